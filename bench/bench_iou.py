@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+#
+# bench_iou.py
+#
+# IouEngine.compute_iou_for_image on one synthetic image with a growing number of boxes,
+# full broadcast against sort and sweep pruning:
+#
+#   ./bench/bench_iou.py [--sizes 100 1000 10000] [--users 3] [--dense-max 5000]
+#
+# boxes are seedling sized (20-80 px) and spread over a 4000x3000 frame, every user labels
+# the same plants with some jitter. the full broadcast is skipped above --dense-max boxes
+#
+import os, sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+import argparse
+import time
+import types
+
+import numpy as np
+from colorama import Fore, Back, Style
+
+import lib.IouEngine as IouEngine
+from lib.BboxStore import BboxStore
+
+
+def make_image(num_boxes, num_users, seed=0):
+    """
+    store and a bbl stand-in with num_boxes boxes of one class split over num_users users
+    """
+    rng = np.random.default_rng(seed)
+    store = BboxStore()
+    seq = store.new_seq()
+    users = [f"user{i}" for i in range(num_users)]
+    plants = num_boxes // num_users
+    xy = rng.integers(0, [4000, 3000], (plants, 2))
+    wh = rng.integers(20, 80, (plants, 2))
+    for user in users:
+        jitter = rng.integers(-5, 6, (plants, 4))
+        boxes = np.concatenate([xy, xy + wh], axis=1) + jitter
+        for bbox in boxes.tolist():
+            obj = store.add('dir', 'file', 'image', 'leaf', 'outer', 0, bbox)
+            obj.user = user
+            seq.append(obj)
+    bbl = types.SimpleNamespace(store=store, bbox_obj_list={'image': seq},
+                                stats=types.SimpleNamespace(user_list=users))
+    return bbl
+
+
+def run(bbl, prune_pairs, rounds):
+    IouEngine.PRUNE_PAIRS = prune_pairs
+    engine = IouEngine.IouEngine(bbl)
+    best = float('inf')
+    for _ in range(rounds):
+        start = time.perf_counter()
+        engine.compute_iou_for_image('image')
+        best = min(best, time.perf_counter() - start)
+    store = bbl.store
+    return best, store.iou[:store.size].copy(), store.associated_user[:store.size].copy()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100, 300, 1000, 3000, 10000])
+    parser.add_argument('--users', type=int, default=3)
+    parser.add_argument('--rounds', type=int, default=3)
+    parser.add_argument('--dense-max', type=int, default=5000, help='largest box count run with the full broadcast')
+    args = parser.parse_args()
+
+    col = Fore.BLACK + Back.CYAN
+    print(f"     {col} boxes per image, {args.users} users, best of {args.rounds} " + Style.RESET_ALL)
+    for num_boxes in args.sizes:
+        bbl = make_image(num_boxes, args.users)
+        pruned, iou, assoc = run(bbl, 0, args.rounds)
+        line = f"     {num_boxes:6d} boxes: pruned {pruned * 1000:9.2f} ms"
+        if num_boxes <= args.dense_max:
+            dense, iou_d, assoc_d = run(bbl, float('inf'), args.rounds)
+            same = np.array_equal(iou, iou_d, equal_nan=True) and np.array_equal(assoc, assoc_d, equal_nan=True)
+            line += f" | broadcast {dense * 1000:9.2f} ms | {'same' if same else Fore.RED + 'DIFFERENT' + Style.RESET_ALL}"
+        print(line)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+#
+# bench_navigation.py
+#
+# next-image latency of the gui with --trace off and on. runs without a display:
+#
+#   QT_QPA_PLATFORM=offscreen ./bench/bench_navigation.py --data <dirs> --out <dir> [--rounds 3]
+#
+# 'call' is the time spent in open_next_image, 'shown' runs until the overlay is on the canvas
+#
+import os, sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+import statistics
+import tempfile
+import time
+
+from colorama import Fore, Back, Style
+
+from compare_image_annotations import parse_args, validate_args, setup_logging
+from lib.BboxList import BboxList
+from lib.Trace import Trace
+
+
+def wait_until_idle(app, win):
+    while True:
+        app.processEvents()
+        busy = win.redraw_timer.isActive() or (win.render_future is not None and not win.render_future.done())
+        if not busy:
+            app.processEvents()
+            return
+        time.sleep(0.0005)
+
+
+def navigate(app, win, num_images):
+    """
+    walk forward through the list, returns [(call, shown)] seconds per step
+    """
+    win.cur_img_idx = 0
+    win.simulate_file_item_double_clicked()
+    wait_until_idle(app, win)
+    times = []
+    for _ in range(num_images - 1):
+        start = time.perf_counter()
+        win.open_next_image()
+        call = time.perf_counter() - start
+        wait_until_idle(app, win)
+        times.append((call, time.perf_counter() - start))
+    return times
+
+
+def main():
+    parser = parse_args()
+    parser.add_argument('--rounds', type=int, default=3, help='walks through the image list per setting')
+    args = parser.parse_args()
+    if not validate_args(args):
+        print("needs valid --data dirs")
+        return 2
+    if not args.out:
+        args.out = tempfile.mkdtemp()
+    os.makedirs(args.out, exist_ok=True)
+    setup_logging(args)
+
+    from libs.labelImg import run_main_gui
+    bbl = BboxList(args)
+    app, win = run_main_gui(bbl, args)
+    wait_until_idle(app, win)
+    num_images = len(win.m_img_list)
+
+    # first walk parses xml and fills the caches, not measured
+    navigate(app, win, num_images)
+
+    col = Fore.BLACK + Back.CYAN
+    print(f"     {col} {num_images} images x {args.rounds} rounds " + Style.RESET_ALL)
+    for trace in (False, True):
+        Trace.enabled = trace
+        times = []
+        for _ in range(args.rounds):
+            times.extend(navigate(app, win, num_images))
+        calls = [call * 1000 for call, _ in times]
+        shown = [shown * 1000 for _, shown in times]
+        print(f"     trace {'on ' if trace else 'off'}: call median {statistics.median(calls):7.2f} ms"
+              f" mean {statistics.mean(calls):7.2f} ms | shown median {statistics.median(shown):7.2f} ms"
+              f" mean {statistics.mean(shown):7.2f} ms")
+
+    win.close()
+    app.processEvents()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
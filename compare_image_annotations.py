@@ -10,14 +10,13 @@ import os, sys
 sys.path.append(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
 import argparse
 import logging
+import multiprocessing
 import colorama
 from colorama import Fore, Back, Style
 import shlex
 from pathlib import Path
 import tempfile
 
-from PySide6.QtWidgets import (QLineEdit, QPushButton, QApplication, QVBoxLayout, QDialog)
-
 sys.tracebacklimit = None
 
 from lib.Bbox     import Bbox 
@@ -26,10 +25,12 @@ from lib.Parser   import Parser
 from lib.Plotter  import Plotter
 from lib.constants import VERSION, BUILD_DATE, AUTHOR
 from lib.CustomFormatter import CustomFormatter
+from lib.LogQueue import LogQueue
+from lib.BatchRunner import BatchRunner
+from lib.AgreementReport import AgreementReport
+from lib.Trace import Trace
 
-from libs.labelImg import run_main_gui
-
-from libs.argsDialog import ArgsDialog, Results
+# Qt modules are imported on demand so that --batch runs on a headless server
 
 __author__      = 'deep@tensorfield.ag'
 __copyright__   = 'Copyright (C) 2021 - Tensorfield Ag '
@@ -44,10 +45,26 @@ def parse_args() -> argparse.Namespace:
     parser = argparse.ArgumentParser(
         description='compare annotations in xml format between different image label sets')
     parser.add_argument('--verbose', action='store_true')
+    parser.add_argument('--trace', action='store_true', help='log caller and stack in gui debug messages')
+    parser.add_argument('--log-level', choices=['debug', 'info', 'warning', 'error'], default='debug',
+                        help='level of messages written to debug.log')
+    parser.add_argument('--log-queue', action='store_true', help='write log messages from a background thread')
     parser.add_argument('--prune',   action='store_true')
     parser.add_argument('--check', choices=['relaxed', 'normal', 'strict'], default='normal')
     parser.add_argument('--data', required=False, help='xml and image directories', nargs='+')
     parser.add_argument('--out', required=False, help='output directory')
+    parser.add_argument('--batch', action='store_true', help='compare all images without gui, write csv/json to --out')
+    parser.add_argument('--report', action='store_true', help='agreement with the ref user per class and user over all images, written to --out')
+    parser.add_argument('--plot', action='store_true', help='write a report jpg per image and class to --out/plots')
+    parser.add_argument('--match', choices=['greedy', 'hungarian'], help='batch: match boxes one-to-one against the ref user and report tp/fp/fn')
+    parser.add_argument('--match-iou', type=float, default=0.5, help='lowest iou that counts as a match, in (0, 1]')
+    parser.add_argument('--jobs', type=int, default=0, help='xml parse processes in batch mode (0 = all cores)')
+    parser.add_argument('--cache', required=False, help='parse cache directory (default ~/.cache/compare_image_annotations)')
+    parser.add_argument('--no-cache', action='store_true', help='always re-parse every xml and keep no reduced images on disk')
+    parser.add_argument('--prefetch', type=int, default=2, help='images before/after the current one to load in the background')
+    parser.add_argument('--overlay-cache-mb', type=int, default=256, help='memory budget for rendered overlays, split evenly between finished overlays and the layers they are composited from')
+    parser.add_argument('--no-pyramid', action='store_true', help='always decode images at full resolution')
+    parser.add_argument('--pyramid-cache-mb', type=int, default=512, help='disk budget for reduced resolution images under --cache')
 
     return parser
 
@@ -62,6 +79,10 @@ def validate_args(args: argparse.Namespace):
                 valid = False
                 logging.error(f' data dir {data} does not exist')
 
+    if not 0 < args.match_iou <= 1:
+        valid = False
+        logging.error(f' --match-iou {args.match_iou} must be in (0, 1]')
+
     return valid
 
 def setup_logging(args):
@@ -86,14 +107,21 @@ def setup_logging(args):
 
     file_handler = logging.FileHandler(filename=log_file_path)
     file_handler.setFormatter(CustomFormatter(type='long',color=False))
-    file_handler.setLevel(logging.DEBUG)
+    file_handler.setLevel(args.log_level.upper())
     log.addHandler(file_handler)
-    log.setLevel(logging.DEBUG)
+    # records below every handler's level are dropped before they are built
+    log.setLevel(min(stream_handler.level, file_handler.level))
     log.removeHandler(log.handlers[0])  # key to avoid seeing double!
 
+    if args.log_queue:
+        LogQueue.start(log)
+
     return log
 
 def run_args_gui():
+    from PySide6.QtWidgets import QApplication
+    from libs.argsDialog import ArgsDialog, Results
+
     app = QApplication(sys.argv)
     res = Results()
     args_dialog  = ArgsDialog( text="Enter Args", res=res )
@@ -119,7 +147,12 @@ def main():
     parser = parse_args()
     args = parser.parse_args()
     # use gui if invalid args, otherwise proceed
-    if not validate_args(args):
+    valid = validate_args(args)
+    if not valid and (args.batch or args.report or args.plot):
+        logging.error(f"--batch, --report and --plot need valid --data dirs and options")
+        return 2
+
+    if not valid:
         argString = run_args_gui()
         if argString is None:
             print(Style.BRIGHT + Fore.GREEN + Back.BLACK, end='')
@@ -133,9 +166,11 @@ def main():
 
     if not args.out:
         args.out = tempfile.mkdtemp()
+    os.makedirs(args.out, exist_ok=True)
 
     setup_logging(args)
     logging.info(args)
+    Trace.enabled = args.trace
 
     # return if validate fails to find dirs
     #if err := validate_args(args):
@@ -145,6 +180,20 @@ def main():
 
     bbl = BboxList(args)
     print(f"     {col} checking xml " + Style.RESET_ALL)
+    if args.batch or args.report or args.plot:
+        if args.batch:
+            BatchRunner(bbl, args).run()
+        if args.report:
+            AgreementReport(bbl, args).run()
+        if args.plot:
+            plot_dir = os.path.join(args.out, "plots")
+            print(f"     {col} plotting reports " + Style.RESET_ALL)
+            num_files = bbl.pl.plot_iou_boxes(bbl, plot_dir, args.jobs or os.cpu_count())
+            print(f"     -> {num_files} reports in {plot_dir}")
+        bbl.parser.log_cache_stats()
+        return 0
+
+    from libs.labelImg import run_main_gui
     print(f"     {col} loading gui " + Style.RESET_ALL)
     app, _win = run_main_gui(bbl, args)
     print(f"     {col} display xml " + Style.RESET_ALL)
@@ -156,4 +205,6 @@ def main():
 
 
 if __name__ == "__main__":
+    # parse workers of a pyinstaller exe re-enter here
+    multiprocessing.freeze_support()
     sys.exit(main())
@@ -0,0 +1,213 @@
+"""
+dataset wide agreement with the reference user, headless, written under --out
+
+    agreement.csv   one row per (class_base_class_type, user): counts, iou mean and histogram, mislabel rate
+    agreement.json  the same rows, per user totals over all classes and the least agreeing user per class
+
+stems are compared in chunks on a process pool. a worker builds its own BboxList for the chunk,
+runs update_image_stats and locate_potential_mislabel on every stem and only sends back the
+chunk's Agreement aggregate and parse cache counts, which are folded into the running totals. neither side keeps boxes
+of finished chunks, so memory stays flat however big the dataset is
+"""
+import csv
+import json
+import logging
+import os
+import time
+
+import numpy as np
+from colorama import Fore, Back, Style
+
+from lib.ProcessPool import pool_map, worker_bbl
+
+
+class Agreement:
+    """
+    picklable aggregate keyed by (class_base, class_type, user), merged with +=
+    """
+    bins = 10
+    counters = "images boxes ref_boxes iou_count iou_sum iou_zero mislabels".split()
+
+    def __init__(self):
+        self.rows = {}
+        self.num_images = 0
+
+    def row(self, key):
+        row = self.rows.get(key)
+        if row is None:
+            row = dict.fromkeys(self.counters, 0)
+            row['hist'] = np.zeros(self.bins, dtype=np.int64)
+            self.rows[key] = row
+        return row
+
+    def add_image(self, bbl, image):
+        """
+        count the boxes of one compared image
+        """
+        self.num_images += 1
+        bbox_obj_list = bbl.bbox_obj_list[image]
+        for class_base in bbl.stats.image_to_class_map[image]:
+            ref_user = bbl.stats.ref_user_map[image][class_base]
+            ious = {}
+            seen = set()
+            for obj in bbl.filter(bbox_obj_list, class_base=class_base):
+                key = (class_base, obj.class_type, obj.user)
+                row = self.row(key)
+                if key not in seen:
+                    seen.add(key)
+                    row['images'] += 1
+                row['boxes'] += 1
+                if obj.warning is not None:
+                    row['mislabels'] += 1
+                if obj.user == ref_user:
+                    row['ref_boxes'] += 1
+                else:
+                    ious.setdefault(key, []).append(obj.iou[ref_user])
+
+            for key, values in ious.items():
+                values = np.array(values, dtype=np.float64)
+                row = self.rows[key]
+                row['iou_count'] += len(values)
+                row['iou_sum'] += float(values.sum())
+                row['iou_zero'] += int((values <= 0).sum())
+                row['hist'] += np.bincount(np.minimum((values * self.bins).astype(np.int64), self.bins - 1),
+                                           minlength=self.bins)
+
+    def __iadd__(self, other):
+        self.num_images += other.num_images
+        for key, other_row in other.rows.items():
+            row = self.row(key)
+            for counter in self.counters:
+                row[counter] += other_row[counter]
+            row['hist'] += other_row['hist']
+        return self
+
+
+def compare_chunk(bbl_type, args, run_state):
+    """
+    worker side of the report pool: load and compare every stem of run_state,
+    returns their Agreement and the worker's parse cache counts
+    """
+    agreement = Agreement()
+    with worker_bbl(bbl_type, args, run_state) as bbl:
+        for image in run_state['stem2xmls']:
+            bbl.load_xml_for_image(image)
+            bbl.locate_potential_mislabel(image)
+            agreement.add_image(bbl, image)
+        cache_stats = bbl.parser.cache_stats()
+    return agreement, cache_stats
+
+
+class AgreementReport:
+
+    fields = "class user images boxes ref_boxes iou_count iou_mean iou_zero_rate mislabels mislabel_rate".split()
+    chunk_size = 64
+
+    def __init__(self, bbl, args):
+        self.bbl = bbl
+        self.args = args
+        self.out_dir = args.out
+        self.agreement = Agreement()
+
+    def run(self):
+        images = sorted(self.bbl.stem2xmls.keys())
+        chunks = [self.bbl.run_state(images[i:i + self.chunk_size])
+                  for i in range(0, len(images), self.chunk_size)]
+        jobs = self.args.jobs or os.cpu_count()
+        start = time.perf_counter()
+
+        tasks = ((None, (type(self.bbl), self.args, chunk)) for chunk in chunks)
+        for _, (agreement, cache_stats) in pool_map(compare_chunk, tasks, jobs if len(chunks) > 1 else 1):
+            self.bbl.parser.add_cache_stats(cache_stats)
+            self.add(agreement, len(images), start)
+
+        elapsed = time.perf_counter() - start
+        rows = self.report_rows()
+        csv_path = self.write_csv(rows)
+        json_path = self.write_json(rows, elapsed)
+
+        col = Fore.BLACK + Back.CYAN
+        print(f"     {col} agreement over {self.agreement.num_images} images in {elapsed:.1f}s " + Style.RESET_ALL)
+        for cls, least in self.least_agreeing(rows).items():
+            print(f"     {cls:24s} least agreeing: {least['user']} iou_mean={least['iou_mean']}")
+        for path in (csv_path, json_path):
+            print(f"     -> {path}")
+
+    def add(self, agreement, num_images, start):
+        before = self.agreement.num_images
+        self.agreement += agreement
+        done = self.agreement.num_images
+        if done // 1000 != before // 1000:
+            elapsed = time.perf_counter() - start
+            print(f"     -> {done}/{num_images} images in {elapsed:.1f}s")
+        logging.debug(f"agreement: {done}/{num_images} images, {len(self.agreement.rows)} rows")
+
+    def report_rows(self):
+        rows = []
+        for (class_base, class_type, user), row in sorted(self.agreement.rows.items()):
+            iou_count = row['iou_count']
+            report = {
+                'class': f"{class_base}_{class_type}",
+                'user': user,
+                **{counter: row[counter] for counter in ('images', 'boxes', 'ref_boxes', 'iou_count', 'mislabels')},
+                'iou_mean': round(row['iou_sum'] / iou_count, 3) if iou_count else None,
+                'iou_zero_rate': round(row['iou_zero'] / iou_count, 3) if iou_count else None,
+                'mislabel_rate': round(row['mislabels'] / row['boxes'], 4) if row['boxes'] else None,
+                'hist': row['hist'].tolist(),
+            }
+            rows.append(report)
+        return rows
+
+    def least_agreeing(self, rows):
+        """
+        per class the user with the lowest iou mean against the reference
+        """
+        least = {}
+        for row in rows:
+            if row['iou_mean'] is None:
+                continue
+            if row['class'] not in least or row['iou_mean'] < least[row['class']]['iou_mean']:
+                least[row['class']] = row
+        return least
+
+    def hist_fields(self):
+        step = 1 / Agreement.bins
+        return [f"iou_{i * step:.1f}-{(i + 1) * step:.1f}" for i in range(Agreement.bins)]
+
+    def write_csv(self, rows):
+        path = os.path.join(self.out_dir, "agreement.csv")
+        hist_fields = self.hist_fields()
+        with open(path, "w", newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=self.fields + hist_fields)
+            writer.writeheader()
+            for row in rows:
+                out = {field: row[field] for field in self.fields}
+                out.update(zip(hist_fields, row['hist']))
+                writer.writerow(out)
+        return path
+
+    def write_json(self, rows, elapsed):
+        users = {}
+        for (_, _, user), row in self.agreement.rows.items():
+            total = users.setdefault(user, dict.fromkeys(('boxes', 'iou_count', 'iou_sum', 'mislabels'), 0))
+            for counter in total:
+                total[counter] += row[counter]
+        report = {
+            'images': self.agreement.num_images,
+            'seconds': round(elapsed, 3),
+            'check': self.args.check,
+            'data': self.args.data,
+            'hist_bins': self.hist_fields(),
+            'classes': rows,
+            'users': {user: {
+                'boxes': total['boxes'],
+                'iou_count': total['iou_count'],
+                'iou_mean': round(total['iou_sum'] / total['iou_count'], 3) if total['iou_count'] else None,
+                'mislabel_rate': round(total['mislabels'] / total['boxes'], 4) if total['boxes'] else None,
+            } for user, total in sorted(users.items())},
+            'least_agreeing': {cls: row['user'] for cls, row in self.least_agreeing(rows).items()},
+        }
+        path = os.path.join(self.out_dir, "agreement.json")
+        with open(path, "w") as f:
+            json.dump(report, f, indent=2)
+        return path
@@ -0,0 +1,233 @@
+"""
+headless comparison of every image: no Qt, results written as csv/json under --out
+
+    boxes.csv        one row per box with its iou against the reference user
+    image_stats.csv  one row per (image, class_base, user)
+    summary.json     totals per (class_base, user) over the whole dataset
+
+with --match every box is also matched one-to-one against the ref user (see BoxMatcher):
+boxes.csv gets the iou of the matched pair, image_stats.csv and summary.json tp/fp/fn
+
+stems are compared in chunks on a process pool, like AgreementReport: a worker builds its own BboxList
+for the chunk and sends back the csv rows and totals, which are written and folded in chunk order.
+no boxes outlive their chunk, so memory stays flat however big the dataset is
+"""
+from collections import defaultdict
+import csv
+import json
+import os
+import time
+
+from colorama import Fore, Back, Style
+
+from lib.BoxMatcher import BoxMatcher
+from lib.ProcessPool import pool_map, worker_bbl
+
+
+def compare_chunk(bbl_type, args, run_state):
+    """
+    worker side of the batch pool: load and compare every stem of run_state,
+    returns their (box_rows, image_rows, num_boxes), totals (see BatchRunner.plain_totals)
+    and the worker's parse cache counts
+    """
+    box_rows = []
+    image_rows = []
+    num_boxes = 0
+    with worker_bbl(bbl_type, args, run_state) as bbl:
+        runner = BatchRunner(bbl, args)
+        for image in run_state['stem2xmls']:
+            bbl.load_xml_for_image(image)
+            bbl.locate_potential_mislabel(image)
+            num_boxes += runner.compare_image(image, box_rows, image_rows)
+        cache_stats = bbl.parser.cache_stats()
+    return (box_rows, image_rows, num_boxes), runner.plain_totals(), cache_stats
+
+
+class BatchRunner:
+
+    box_fields = "image class_base class_type user ref_user iou_ref xmin ymin xmax ymax difficult warning file".split()
+    image_fields = "image class_base user ref_user outer inner iou_min iou_mean iou_max mislabels".split()
+    chunk_size = 64
+
+    def __init__(self, bbl, args):
+        self.bbl = bbl
+        self.args = args
+        self.out_dir = args.out
+        # totals[class_base][user]
+        self.totals = defaultdict(lambda: defaultdict(lambda: defaultdict(float)))
+        self.matcher = None
+        if args.match:
+            self.matcher = BoxMatcher(bbl, args.match, args.match_iou)
+            self.box_fields = self.box_fields + ['match_iou']
+            self.image_fields = self.image_fields + "tp fp fn".split()
+
+    def run(self):
+        """
+        compare every image in chunks and write the rows in image order
+        """
+        images = sorted(self.bbl.stem2xmls.keys())
+        num_images = len(images)
+        num_boxes = 0
+        done = 0
+        start = time.perf_counter()
+
+        chunks = [self.bbl.run_state(images[i:i + self.chunk_size])
+                  for i in range(0, len(images), self.chunk_size)]
+        jobs = self.args.jobs or os.cpu_count()
+        tasks = ((len(chunk['stem2xmls']), (type(self.bbl), self.args, chunk)) for chunk in chunks)
+
+        boxes_path = os.path.join(self.out_dir, "boxes.csv")
+        image_path = os.path.join(self.out_dir, "image_stats.csv")
+        with open(boxes_path, "w", newline='') as boxes_file, open(image_path, "w", newline='') as image_file:
+            box_writer = csv.DictWriter(boxes_file, fieldnames=self.box_fields)
+            image_writer = csv.DictWriter(image_file, fieldnames=self.image_fields)
+            box_writer.writeheader()
+            image_writer.writeheader()
+
+            for chunk_images, (rows, totals, cache_stats) in pool_map(compare_chunk, tasks, jobs if len(chunks) > 1 else 1):
+                box_rows, image_rows, chunk_boxes = rows
+                box_writer.writerows(box_rows)
+                image_writer.writerows(image_rows)
+                self.add_totals(totals)
+                self.bbl.parser.add_cache_stats(cache_stats)
+                num_boxes += chunk_boxes
+                if (done + chunk_images) // 1000 != done // 1000:
+                    elapsed = time.perf_counter() - start
+                    print(f"     -> {done + chunk_images}/{num_images} images {num_boxes} boxes in {elapsed:.1f}s")
+                done += chunk_images
+
+        elapsed = time.perf_counter() - start
+        summary_path = self.write_summary(num_images, num_boxes, elapsed)
+
+        col = Fore.BLACK + Back.CYAN
+        print(f"     {col} compared {num_images} images / {num_boxes} boxes in {elapsed:.1f}s " + Style.RESET_ALL)
+        for path in (boxes_path, image_path, summary_path):
+            print(f"     -> {path}")
+
+    def compare_image(self, image, box_rows, image_rows):
+        """
+        append the rows of one loaded image and add it to the totals, returns number of boxes
+        """
+        bbox_obj_list = self.bbl.bbox_obj_list[image]
+        users = self.bbl.stats.image_to_active_users_map[image]
+        if self.matcher:
+            counts, match_iou = self.matcher.match_image(image)
+        for class_base in self.bbl.stats.image_to_class_map[image]:
+            ref_user = self.bbl.get_best_ref_user(image, class_base)
+            stats = {user: defaultdict(int) for user in users}
+            ious = defaultdict(list)
+
+            for obj in self.bbl.filter(bbox_obj_list, class_base=class_base):
+                iou_ref = None
+                if obj.user != ref_user:
+                    iou_ref = obj.iou[ref_user]
+                    ious[obj.user].append(iou_ref)
+                stats[obj.user][obj.class_type] += 1
+                if obj.warning is not None:
+                    stats[obj.user]['mislabels'] += 1
+
+                xmin, ymin, xmax, ymax = obj.bbox
+                row = {
+                    'image': image, 'class_base': class_base, 'class_type': obj.class_type,
+                    'user': obj.user, 'ref_user': ref_user, 'iou_ref': iou_ref,
+                    'xmin': xmin, 'ymin': ymin, 'xmax': xmax, 'ymax': ymax,
+                    'difficult': obj.difficult,
+                    'warning': None if obj.warning is None else obj.warning.replace('\n', ' vs '),
+                    'file': obj.file,
+                }
+                if self.matcher and obj.user != ref_user:
+                    value = match_iou.get(obj.idx)
+                    row['match_iou'] = None if value is None else round(value, 3)
+                box_rows.append(row)
+
+            for user in users:
+                user_ious = ious[user]
+                row = {
+                    'image': image, 'class_base': class_base, 'user': user, 'ref_user': ref_user,
+                    'outer': stats[user]['outer'], 'inner': stats[user]['inner'],
+                    'mislabels': stats[user]['mislabels'],
+                }
+                if user_ious:
+                    row['iou_min'] = min(user_ious)
+                    row['iou_mean'] = round(sum(user_ious) / len(user_ious), 3)
+                    row['iou_max'] = max(user_ious)
+                if self.matcher and user != ref_user:
+                    count = counts[class_base][user]
+                    row.update(tp=count['tp'], fp=count['fp'], fn=count['fn'])
+                image_rows.append(row)
+
+                total = self.totals[class_base][user]
+                total['images'] += 1
+                total['ref_images'] += int(user == ref_user)
+                total['outer'] += stats[user]['outer']
+                total['inner'] += stats[user]['inner']
+                total['mislabels'] += stats[user]['mislabels']
+                total['iou_sum'] += sum(user_ious)
+                total['iou_count'] += len(user_ious)
+                if self.matcher and user != ref_user:
+                    for key in ('tp', 'fp', 'fn'):
+                        total[key] += counts[class_base][user][key]
+
+        return len(bbox_obj_list)
+
+    def plain_totals(self):
+        """
+        totals as plain dicts, picklable for pool workers to send back
+        """
+        return {class_base: {user: dict(total) for user, total in users.items()}
+                for class_base, users in self.totals.items()}
+
+    def add_totals(self, totals):
+        for class_base, users in totals.items():
+            for user, total in users.items():
+                for key, value in total.items():
+                    self.totals[class_base][user][key] += value
+
+    def write_summary(self, num_images, num_boxes, elapsed):
+        summary = {
+            'images': num_images,
+            'boxes': num_boxes,
+            'seconds': round(elapsed, 3),
+            'check': self.args.check,
+            'data': self.args.data,
+            'classes': {},
+        }
+        if self.matcher:
+            summary['match'] = {'method': self.matcher.method, 'min_iou': self.matcher.min_iou}
+        for class_base in sorted(self.totals):
+            summary['classes'][class_base] = {}
+            for user in sorted(self.totals[class_base]):
+                total = self.totals[class_base][user]
+                iou_count = int(total['iou_count'])
+                summary['classes'][class_base][user] = {
+                    'images': int(total['images']),
+                    'ref_images': int(total['ref_images']),
+                    'outer': int(total['outer']),
+                    'inner': int(total['inner']),
+                    'mislabels': int(total['mislabels']),
+                    'iou_mean': round(total['iou_sum'] / iou_count, 3) if iou_count else None,
+                    'iou_count': iou_count,
+                }
+                if self.matcher:
+                    summary['classes'][class_base][user].update(self.match_summary(total))
+
+        summary_path = os.path.join(self.out_dir, "summary.json")
+        with open(summary_path, "w") as f:
+            json.dump(summary, f, indent=2)
+        return summary_path
+
+    @staticmethod
+    def match_summary(total):
+        """
+        tp/fp/fn totals of one (class_base, user) with precision, recall and f1 against the ref user
+        """
+        tp, fp, fn = (int(total[key]) for key in ('tp', 'fp', 'fn'))
+        precision = tp / (tp + fp) if tp + fp else None
+        recall = tp / (tp + fn) if tp + fn else None
+        f1 = 2 * tp / (2 * tp + fp + fn) if tp + fp + fn else None
+        return {
+            'tp': tp, 'fp': fp, 'fn': fn,
+            'precision': None if precision is None else round(precision, 3),
+            'recall': None if recall is None else round(recall, 3),
+            'f1': None if f1 is None else round(f1, 3),
+        }
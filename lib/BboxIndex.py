@@ -0,0 +1,86 @@
+"""
+BboxIndex: group-by index over the boxes of one image
+
+positions of boxes are bucketed by (class_base, class_type, user, dir) codes once, so
+BboxList.filter and friends answer from the buckets instead of scanning the whole list.
+an index is only valid for the BboxSeq version and BboxStore generation it was built from;
+BboxSeq.assign rewrites a column for one image without touching the generation
+"""
+from collections import defaultdict
+
+import numpy as np
+
+
+class BboxIndex:
+    keys = ('class_base', 'class_type', 'user', 'dir')
+
+    def __init__(self, seq):
+        self.seq = seq
+        self.store = seq.store
+        self.version = (seq.version, self.store.generation)
+        self.idx = seq.index_array()
+
+        buckets = defaultdict(list)
+        columns = [self.store.codes[key][self.idx].tolist() for key in self.keys]
+        for pos, key in enumerate(zip(*columns)):
+            buckets[key].append(pos)
+        self.buckets = {key: np.array(pos, dtype=np.int64) for key, pos in buckets.items()}
+        self.memo = {}
+
+    def is_valid(self):
+        return self.version == (self.seq.version, self.store.generation)
+
+    @classmethod
+    def indexed(cls, criteria):
+        return all(key in cls.keys for key in criteria)
+
+    def codes_for(self, criteria):
+        """
+        map string criteria to sets of codes, a value can be a single string or a collection of them
+        """
+        codes = {}
+        for key, value in criteria.items():
+            if isinstance(value, (list, tuple, set, frozenset)):
+                values = value
+            else:
+                values = [value]
+            table = self.store.tables[key].codes
+            codes[self.keys.index(key)] = {table.get(v, -2) if v is not None else -1 for v in values}
+        return codes
+
+    def positions(self, criteria, negate=False):
+        """
+        sorted positions of boxes matching all criteria (or, with negate, differing on all of them)
+        """
+        memo_key = (negate, tuple(sorted((k, v if isinstance(v, str) or v is None else frozenset(v))
+                                         for k, v in criteria.items())))
+        if memo_key in self.memo:
+            return self.memo[memo_key]
+
+        codes = self.codes_for(criteria)
+        if negate:
+            match = lambda key: all(key[i] not in c for i, c in codes.items())
+        else:
+            match = lambda key: all(key[i] in c for i, c in codes.items())
+        found = [pos for key, pos in self.buckets.items() if match(key)]
+
+        if not found:
+            positions = np.empty(0, dtype=np.int64)
+        elif len(found) == 1:
+            positions = found[0]
+        else:
+            # keep list order
+            positions = np.sort(np.concatenate(found))
+        self.memo[memo_key] = positions
+        return positions
+
+    def views(self, positions):
+        store = self.store
+        view = store.view
+        return [view(idx) for idx in self.idx[positions].tolist()]
+
+    def select(self, **criteria):
+        return self.views(self.positions(criteria))
+
+    def rselect(self, **criteria):
+        return self.views(self.positions(criteria, negate=True))
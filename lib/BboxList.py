@@ -10,11 +10,20 @@ from glob import glob
 from pathlib import Path
 #import pudb
 import logging
+import threading
 from random import randint
 
+import numpy as np
+
 from lib.Parser  import Parser
 from lib.Plotter import Plotter
 from lib.Bbox    import Bbox, DeepDict
+from lib.BboxStore import BboxStore, BboxSeq
+from lib.BboxIndex import BboxIndex
+from lib.CenterGrid import CenterGrid
+from lib.IouEngine import IouEngine
+from lib.ImageMeta import ImageMeta
+from lib.LogSummary import LogSummary
 
 
 class Stats:
@@ -35,46 +44,76 @@ class Stats:
 
 
 class BboxList:
-    def __init__(self, args):
-        self.bbox_obj_list = defaultdict(list)
+    def __init__(self, args, run_state=None):
+        # all boxes live in one columnar store, bbox_obj_list[image] is a BboxSeq of views into it
+        self.store = BboxStore()
+        self.bbox_obj_list = defaultdict(self.store.new_seq)
         self.args = args;
         self.stats = Stats()
         # after every update to bbox_obj_list , stats needs to be regenerated
         self.stem2xmls = defaultdict(list)
         self.stem2jpgs = defaultdict(list)
         self.loaded = defaultdict(lambda: False)
+        self.parsed = defaultdict(lambda: False)
+        # loads may run on the gui prefetch thread, one at a time
+        self.lock = threading.RLock()
+        self.image_meta = ImageMeta(self)
         self.pl = Plotter(self,args)
-        self.parser = Parser(self,args)
+        self.parser = Parser(self, args, scan=run_state is None)
+        self.iou_engine = IouEngine(self)
+        if run_state is not None:
+            self.restore_run_state(run_state)
 
     # entry routines
     def load_xml_for_image(self, image):
-        if self.loaded[image]:
-            return True
-        self.parser.parse_xml_associated_with_image(image)
-        self.update_image_stats(image)
+        with self.lock:
+            if self.loaded[image]:
+                return True
+            if not self.parsed[image]:
+                self.parser.parse_xml_associated_with_image(image)
+                self.parsed[image] = True
+            self.update_image_stats(image)
+
+            self.loaded[image] = True
+
+    def iter_parse_images(self, images, jobs):
+        """
+        parse the xml of many images over jobs processes, yielding each image once its boxes are in
+        """
+        images = [image for image in images if not self.parsed[image]]
+        for image in self.parser.iter_parse_stems(images, jobs):
+            self.parsed[image] = True
+            yield image
 
-        self.loaded[image] = True
+    # filter functions take any list of boxes; the whole per image BboxSeq is answered
+    # from its group-by index, other lists are scanned
 
-    # TODO: combine filter functions 
     # search objects with NOT matching parameters
     def rfilter(self, bbox_obj_list,  **kwargs):
+        if isinstance(bbox_obj_list, BboxSeq) and BboxIndex.indexed(kwargs):
+            return bbox_obj_list.index().rselect(**kwargs)
         items = []
         for item in bbox_obj_list:
-            if all(item.__dict__[k] != v for k, v in kwargs.items()):
+            if all(getattr(item, k) != v for k, v in kwargs.items()):
                 items.append(item)
         return items
 
     # search objects with matching parameters
     def filter(self, bbox_obj_list,  **kwargs):
+        if isinstance(bbox_obj_list, BboxSeq) and BboxIndex.indexed(kwargs):
+            return bbox_obj_list.index().select(**kwargs)
         items = []
         for item in bbox_obj_list:
-            if all(item.__dict__[k] == v for k, v in kwargs.items()):
+            if all(getattr(item, k) == v for k, v in kwargs.items()):
                 items.append(item)
         return items
 
     # prine list based on visible_users dict
     # TODO: check that Stats has been run and db is not dirty
     def filter_visible_users(self, bbox_obj_list, visible_users):
+        if isinstance(bbox_obj_list, BboxSeq):
+            users = [user for user, visible in visible_users.items() if visible]
+            return bbox_obj_list.index().select(user=users)
         items = []
         for item in bbox_obj_list:
             if visible_users[item.user]:
@@ -82,8 +121,16 @@ class BboxList:
         return items
 
     def filter_by_iou_value(self, bbox_obj_list, ref_user, iou_filter_value):
-        items = []
         iou_threshold = iou_filter_value / 10.0
+        if isinstance(bbox_obj_list, BboxSeq):
+            idx = bbox_obj_list.index_array()
+            ref_code = self.store.user.codes.get(ref_user, -2)
+            is_ref = self.store.codes['user'][idx] == ref_code
+            keep = is_ref
+            if ref_code >= 0:
+                keep = is_ref | (self.store.iou[idx, ref_code] < iou_threshold)
+            return [self.store.view(i) for i in idx[keep].tolist()]
+        items = []
         # don't prube ref user
         for item in bbox_obj_list:
             if item.user != ref_user:
@@ -96,9 +143,32 @@ class BboxList:
 
     def update_run_stats(self):
         self.stats.image_list  = self.get_image_list()
-        self.stats.user_to_dir_map, self.stats.dir_to_user_map    = self.get_user_map()
+        self.set_user_map(*self.get_user_map())
+
+    def run_state(self, images):
+        """
+        picklable scan results for images, enough for a worker process to load and compare them
+        """
+        return {
+            'stem2xmls': {image: self.stem2xmls[image] for image in images},
+            'stem2jpgs': {image: self.stem2jpgs[image] for image in images},
+            'user_to_dir_map': dict(self.stats.user_to_dir_map),
+        }
+
+    def restore_run_state(self, state):
+        self.stem2xmls.update(state['stem2xmls'])
+        self.stem2jpgs.update(state['stem2jpgs'])
+        self.stats.image_list = list(state['stem2xmls'])
+        user_to_dir_map = state['user_to_dir_map']
+        self.set_user_map(user_to_dir_map, defaultdict(str, {d: user for user, d in user_to_dir_map.items()}))
+
+    def set_user_map(self, user_to_dir_map, dir_to_user_map):
+        self.stats.user_to_dir_map, self.stats.dir_to_user_map = user_to_dir_map, dir_to_user_map
         self.stats.user_list   = self.stats.user_to_dir_map.keys()
         self.stats.dir_list    = self.stats.dir_to_user_map.keys()
+        # intern users up front so store columns follow user_list order
+        for user in self.stats.user_list:
+            self.store.intern_user(user)
 
     def update_image_stats(self, image):
         self.get_image_to_class_map(image)
@@ -112,7 +182,7 @@ class BboxList:
         return list of images in all annotations
         """
         image_list = list(self.stem2jpgs.keys())
-        logging.info(f" {image_list=}")
+        logging.info(" image_list=%s", LogSummary(image_list))
         return image_list
 
     def get_user_map(self):
@@ -127,13 +197,13 @@ class BboxList:
                 dirs.append(dir)
         dirs = sorted(set(dirs))
         user_to_dir_map = self.get_min_path_to_make_unique(dirs)
-        logging.info(f" user_to_dir_map = {user_to_dir_map}")
+        logging.info(" user_to_dir_map = %s", LogSummary(user_to_dir_map))
 
         dir_to_user_map = defaultdict(str)
         for user,d  in user_to_dir_map.items():
             dir_to_user_map[d] = user
 
-        logging.info(f" dir_to_user_map = {dir_to_user_map}")
+        logging.info(" dir_to_user_map = %s", LogSummary(dir_to_user_map))
         return user_to_dir_map, dir_to_user_map
 
 
@@ -161,12 +231,12 @@ class BboxList:
         """
         loop through all objects adding the user attribute
         """
-        for obj in self.bbox_obj_list[image]:
-            obj.user = self.stats.dir_to_user_map[obj.dir]
+        seq = self.bbox_obj_list[image]
+        seq.assign('user', [self.stats.dir_to_user_map[obj.dir] for obj in seq])
 
     def get_best_ref_user(self, image, class_base):
-        logging.info(f"ref user= {self.stats.ref_user_map=}")
         ref_user = self.stats.ref_user_map[image][class_base]
+        logging.info(f"ref user for {image} {class_base} = {ref_user}")
         return ref_user
 
     def get_image_to_active_users_map(self, image):
@@ -180,7 +250,7 @@ class BboxList:
             image_to_active_users_map.append(obj.user)
 
         self.stats.image_to_active_users_map[image] = sorted(set(image_to_active_users_map))
-        logging.info(f" {self.stats.image_to_active_users_map=}")
+        logging.info(f" active users for {image} = {self.stats.image_to_active_users_map[image]}")
 
     def get_image_to_class_map(self, image):
         """
@@ -192,13 +262,16 @@ class BboxList:
             image_to_class_map.append(obj.class_base)
 
         self.stats.image_to_class_map[image] = sorted(set(image_to_class_map))
-        logging.info(f" {self.stats.image_to_class_map=}")
+        logging.info(f" classes for {image} = {self.stats.image_to_class_map[image]}")
 
     def associate_stem_with_outer(self, image):
         """
         each outer should have corresponding stem
         """
         bbox_obj_list = self.bbox_obj_list[image]
+        if isinstance(bbox_obj_list, BboxSeq):
+            self.associate_stem_with_outer_indexed(bbox_obj_list)
+            return
         for obj in bbox_obj_list:
             if obj.class_type == 'outer':
                 #logging.info(f"box is outer = {obj}")
@@ -208,8 +281,47 @@ class BboxList:
                         class_type = 'inner')
                 self.compute_center(obj, inner_obj_list)
 
-
-
+    def associate_stem_with_outer_indexed(self, seq):
+        """
+        same result as compute_center for every outer, but each (dir, class_base) group puts its
+        inner centers in a CenterGrid so an outer only measures the centers inside it
+        """
+        store = self.store
+        index = seq.index()
+        outer = index.positions({'class_type': 'outer'})
+        if len(outer) == 0:
+            return
+
+        outer_idx = index.idx[outer]
+        groups = defaultdict(list)
+        keys = zip(store.codes['dir'][outer_idx].tolist(), store.codes['class_base'][outer_idx].tolist())
+        for idx, key in zip(outer_idx.tolist(), keys):
+            groups[key].append(idx)
+
+        for (dir_code, base_code), outer_list in groups.items():
+            inner = index.positions({
+                'dir':        store.tables['dir'].lookup(dir_code),
+                'class_base': store.tables['class_base'].lookup(base_code),
+                'class_type': 'inner'})
+            inner_idx = index.idx[inner]
+            coords = store.coords[inner_idx].astype(np.float64)
+            x = (coords[:, 0] + coords[:, 2]) / 2
+            y = (coords[:, 1] + coords[:, 3]) / 2
+            grid = CenterGrid(x, y)
+
+            for idx in outer_list:
+                obj_src = store.view(idx)
+                xmin, ymin, xmax, ymax = store.coords[idx].tolist()
+                found = grid.query(xmin, ymin, xmax, ymax)
+                if len(found) == 0:
+                    obj_src.meristem = None
+                    continue
+                x_center = (xmin + xmax) / 2
+                y_center = (ymin + ymax) / 2
+                dist = np.sqrt((x_center - x[found])**2 + (y_center - y[found])**2)
+                # argmin takes the first minimum, like the strict < in compute_center
+                obj_src.meristem = store.view(int(inner_idx[found[np.argmin(dist)]]))
+                obj_src.has_associated_inner = True
 
     def compute_center(self, obj_src, inner_obj_list):
         """
@@ -253,7 +365,7 @@ class BboxList:
         # pass1: for each image/class_base find num of annotations and record ref_user
         for obj in bbox_obj_list:
             num_annotations[obj.user][obj.image][obj.class_base][obj.class_type] += 1
-        logging.info(f"{num_annotations=}")
+        logging.debug("num_annotations=%s", LogSummary(num_annotations))
                 
         for user in num_annotations:
             for image in num_annotations[user]:
@@ -265,22 +377,10 @@ class BboxList:
                     if n > max_annotation[image][class_base]:
                         max_annotation[image][class_base] = n
                         self.stats.ref_user_map[image][class_base] = user
-        logging.info(f"ref user= {self.stats.ref_user_map}")
+        logging.info(f"ref user for {image} = {dict(self.stats.ref_user_map[image])}")
 
-        # pass2: compute iou for each box relative to all others
-        for obj_src in bbox_obj_list:
-
-            # not matching dir, but matching image/class
-            tgt_all_obj_list = self.filter(bbox_obj_list, 
-                            class_base = obj_src.class_base,
-                            class_type = obj_src.class_type)
-            for user in self.stats.user_list: 
-                if user == obj_src.user:
-                    continue
-                tgt_obj_list = self.filter(tgt_all_obj_list, user = user )
-                #logging.info(f" checking filter for {user} filter for list= {tgt_obj_list}")
-                obj_src.iou[user], _ = self.compute_iou_obj_list(obj_src, tgt_obj_list)
-            #logging.info(f" iou for {obj_src} is {obj_src.iou}")
+        # pass2: compute iou for each box relative to all others, batched per class/user group
+        self.iou_engine.compute_iou_for_image(image)
 
 
     def compute_iou_obj_list(self, obj_src, tgt_obj_list):
@@ -320,6 +420,9 @@ class BboxList:
         area_src = (xmax_src - xmin_src) * (ymax_src - ymin_src)
         area_tgt = (xmax_tgt - xmin_tgt) * (ymax_tgt - ymin_tgt)
         union = area_src + area_tgt - intersection
+        # zero area boxes, same as IouEngine.iou_matrix
+        if union <= 0:
+            return 0.0
 
         iou = intersection / float(union)
         #logging.info(f"bbox_src={bbox_src} bbox_tgt={bbox_tgt} iou={intersection}/{union} = {iou}")
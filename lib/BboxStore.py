@@ -0,0 +1,348 @@
+"""
+BboxStore: struct-of-arrays storage for every bounding box annotation
+
+coordinates, flags and interned string codes live in typed numpy columns that grow by doubling.
+BboxView is a 2 slot handle (store, idx) with the same attribute api as Bbox, and BboxSeq is the
+per image list of store indices that BboxList.bbox_obj_list holds instead of a list of objects
+"""
+from array import array
+from collections.abc import MutableMapping, Sequence
+import os
+
+import numpy as np
+
+from lib.BboxIndex import BboxIndex
+
+
+class StringTable:
+    """
+    intern strings to small int codes, code -1 is None
+    """
+    def __init__(self):
+        self.codes = {}
+        self.names = []
+
+    def intern(self, name):
+        if name is None:
+            return -1
+        code = self.codes.get(name)
+        if code is None:
+            code = len(self.names)
+            self.codes[name] = code
+            self.names.append(name)
+        return code
+
+    def lookup(self, code):
+        return None if code < 0 else self.names[code]
+
+    def __len__(self):
+        return len(self.names)
+
+
+class UserValues(MutableMapping):
+    """
+    dict-like row of a (box, user) column: Bbox.iou and Bbox.associated_user
+    unset entries are nan in the store
+    """
+    __slots__ = ('store', 'column', 'idx')
+
+    def __init__(self, store, column, idx):
+        self.store = store
+        self.column = column
+        self.idx = idx
+
+    def _row(self):
+        return getattr(self.store, self.column)[self.idx]
+
+    def __getitem__(self, user):
+        code = self.store.user.codes.get(user)
+        value = self._row()[code] if code is not None else np.nan
+        if value != value:
+            # associated_user used to be a defaultdict(float)
+            if self.column == 'associated_user':
+                self[user] = 0.0
+                return 0.0
+            raise KeyError(user)
+        # iou of a box with nothing to overlap is stored as -0.0 and was the int 0
+        if value == 0 and np.signbit(value):
+            return 0
+        return float(value)
+
+    def __setitem__(self, user, value):
+        code = self.store.intern_user(user)
+        getattr(self.store, self.column)[self.idx, code] = value
+
+    def __delitem__(self, user):
+        code = self.store.user.codes.get(user)
+        if code is None or self._row()[code] != self._row()[code]:
+            raise KeyError(user)
+        getattr(self.store, self.column)[self.idx, code] = np.nan
+
+    def __iter__(self):
+        row = self._row()
+        for code in np.flatnonzero(~np.isnan(row)).tolist():
+            yield self.store.user.names[code]
+
+    def __len__(self):
+        return int(np.count_nonzero(~np.isnan(self._row())))
+
+    def __repr__(self):
+        return repr(dict(self))
+
+
+def _string_column(name):
+    def fget(self):
+        store = self.store
+        return store.tables[name].lookup(int(store.codes[name][self.idx]))
+
+    def fset(self, value):
+        store = self.store
+        if name == 'user':
+            code = store.intern_user(value)
+        else:
+            code = store.tables[name].intern(value)
+        if store.codes[name][self.idx] != code:
+            store.codes[name][self.idx] = code
+            store.generation += 1
+
+    return property(fget, fset)
+
+
+class BboxView:
+    """
+    lightweight handle on one box in a BboxStore, same attributes as lib.Bbox.Bbox
+    """
+    __slots__ = ('store', 'idx')
+
+    fields = "dir file image class_base class_type difficult bbox meristem has_associated_inner iou associated_user user warning".split()
+
+    def __init__(self, store, idx):
+        self.store = store
+        self.idx = idx
+
+    dir        = _string_column('dir')
+    file       = _string_column('file')
+    image      = _string_column('image')
+    class_base = _string_column('class_base')
+    class_type = _string_column('class_type')
+    user       = _string_column('user')
+
+    @property
+    def bbox(self):
+        return self.store.coords[self.idx].tolist()
+
+    @bbox.setter
+    def bbox(self, value):
+        self.store.coords[self.idx] = value
+
+    @property
+    def difficult(self):
+        return int(self.store.difficult[self.idx])
+
+    @difficult.setter
+    def difficult(self, value):
+        self.store.difficult[self.idx] = value
+
+    @property
+    def has_associated_inner(self):
+        return bool(self.store.has_associated_inner[self.idx])
+
+    @has_associated_inner.setter
+    def has_associated_inner(self, value):
+        self.store.has_associated_inner[self.idx] = value
+
+    @property
+    def meristem(self):
+        idx = int(self.store.meristem[self.idx])
+        return None if idx < 0 else BboxView(self.store, idx)
+
+    @meristem.setter
+    def meristem(self, obj):
+        self.store.meristem[self.idx] = -1 if obj is None else obj.idx
+
+    @property
+    def warning(self):
+        return self.store.warning.get(self.idx)
+
+    @warning.setter
+    def warning(self, value):
+        if value is None:
+            self.store.warning.pop(self.idx, None)
+        else:
+            self.store.warning[self.idx] = value
+
+    @property
+    def iou(self):
+        return UserValues(self.store, 'iou', self.idx)
+
+    @property
+    def associated_user(self):
+        return UserValues(self.store, 'associated_user', self.idx)
+
+    def __eq__(self, other):
+        if not isinstance(other, BboxView):
+            return NotImplemented
+        return self.store is other.store and self.idx == other.idx
+
+    def __hash__(self):
+        return hash(self.idx)
+
+    def __str__(self):
+        return str({field: getattr(self, field) for field in self.fields})
+
+
+class BboxSeq(Sequence):
+    """
+    list of boxes for one image: store indices in an array, views are made on access
+    version is bumped on every change so derived indexes can tell they are stale
+    """
+    __slots__ = ('store', 'indices', 'version', '_index')
+
+    def __init__(self, store, indices=()):
+        self.store = store
+        self.indices = array('q', indices)
+        self.version = 0
+        self._index = None
+
+    def __len__(self):
+        return len(self.indices)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [BboxView(self.store, idx) for idx in self.indices[i]]
+        return BboxView(self.store, self.indices[i])
+
+    def __iter__(self):
+        store = self.store
+        for idx in self.indices:
+            yield BboxView(store, idx)
+
+    def append(self, obj):
+        self.indices.append(obj.idx)
+        self.version += 1
+
+    def extend(self, objs):
+        self.indices.extend(obj.idx for obj in objs)
+        self.version += 1
+
+    def clear(self):
+        del self.indices[:]
+        self.version += 1
+
+    def index_array(self):
+        return np.array(self.indices, dtype=np.int64)
+
+    def assign(self, name, values):
+        """
+        rewrite key column name for every box of the list, in list order. only this list's index
+        goes stale and only if a code changed; setting the column through single views bumps the
+        store generation and so invalidates the index of every image
+        """
+        store = self.store
+        intern = store.intern_user if name == 'user' else store.tables[name].intern
+        codes = np.array([intern(value) for value in values], dtype=np.int32)
+        idx = self.index_array()
+        if not np.array_equal(store.codes[name][idx], codes):
+            store.codes[name][idx] = codes
+            self.version += 1
+
+    def index(self):
+        """
+        group-by index of this list, rebuilt on first use after any change
+        """
+        if self._index is None or not self._index.is_valid():
+            self._index = BboxIndex(self)
+        return self._index
+
+
+class BboxStore:
+    string_columns = "dir file image class_base class_type user".split()
+
+    def __init__(self, capacity=1024, user_capacity=8):
+        self.size = 0
+        self.capacity = capacity
+        self.user_capacity = user_capacity
+        # bumped when a key column of a single box is rewritten in place, see BboxSeq.assign
+        self.generation = 0
+
+        self.tables = {name: StringTable() for name in self.string_columns}
+        self.user = self.tables['user']
+        self.codes = {name: np.full(capacity, -1, dtype=np.int32) for name in self.string_columns}
+
+        self.coords     = np.zeros((capacity, 4), dtype=np.int32)
+        self.difficult  = np.zeros(capacity, dtype=np.uint8)
+        self.has_associated_inner = np.zeros(capacity, dtype=np.bool_)
+        self.meristem   = np.full(capacity, -1, dtype=np.int64)
+        self.iou             = np.full((capacity, user_capacity), np.nan)
+        self.associated_user = np.full((capacity, user_capacity), np.nan)
+        # rare, keep sparse
+        self.warning = {}
+
+    def __len__(self):
+        return self.size
+
+    def new_seq(self):
+        return BboxSeq(self)
+
+    def view(self, idx):
+        return BboxView(self, idx)
+
+    def intern_user(self, user):
+        code = self.user.intern(user)
+        if code >= self.user_capacity:
+            self._grow_users(max(2 * self.user_capacity, code + 1))
+        return code
+
+    def add(self, dir, file, image, class_base, class_type, difficult, bbox):
+        """
+        append one box and return its view
+        """
+        if self.size == self.capacity:
+            self._grow(2 * self.capacity)
+        idx = self.size
+        self.size += 1
+
+        values = {
+            'dir': dir.replace(os.path.sep, '/'),
+            'file': file,
+            'image': image,
+            'class_base': class_base,
+            'class_type': class_type,
+            'user': None,
+        }
+        for name, value in values.items():
+            self.codes[name][idx] = self.tables[name].intern(value)
+        self.coords[idx] = bbox
+        self.difficult[idx] = difficult
+        return BboxView(self, idx)
+
+    def nbytes(self):
+        columns = [self.coords, self.difficult, self.has_associated_inner, self.meristem,
+                   self.iou, self.associated_user, *self.codes.values()]
+        return sum(col.nbytes for col in columns)
+
+    def _grow(self, capacity):
+        def grow(col, fill):
+            new = np.full((capacity,) + col.shape[1:], fill, dtype=col.dtype)
+            new[:self.size] = col[:self.size]
+            return new
+
+        for name in self.string_columns:
+            self.codes[name] = grow(self.codes[name], -1)
+        self.coords     = grow(self.coords, 0)
+        self.difficult  = grow(self.difficult, 0)
+        self.has_associated_inner = grow(self.has_associated_inner, False)
+        self.meristem   = grow(self.meristem, -1)
+        self.iou             = grow(self.iou, np.nan)
+        self.associated_user = grow(self.associated_user, np.nan)
+        self.capacity = capacity
+
+    def _grow_users(self, user_capacity):
+        def grow(col):
+            new = np.full((self.capacity, user_capacity), np.nan)
+            new[:, :self.user_capacity] = col
+            return new
+
+        self.iou             = grow(self.iou)
+        self.associated_user = grow(self.associated_user)
+        self.user_capacity = user_capacity
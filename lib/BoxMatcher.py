@@ -0,0 +1,116 @@
+"""
+BoxMatcher: one-to-one matching of each user's boxes against the reference user
+
+for every (class_base, class_type) of an image the iou matrix between a user's boxes and the
+ref user's boxes is assigned one-to-one, either greedy (highest iou first) or optimal with
+scipy's linear_sum_assignment when scipy is installed. an overlapping pair (iou > 0) from
+min_iou on is a match, so both methods agree even with min_iou 0:
+
+    tp  user box matched to a ref box
+    fp  user box without a ref box
+    fn  ref box without a user box
+"""
+from collections import defaultdict
+import logging
+
+import numpy as np
+
+try:
+    from scipy.optimize import linear_sum_assignment
+except ImportError:
+    linear_sum_assignment = None
+
+from lib.IouEngine import PRUNE_PAIRS, iou_matrix, iou_pairs, overlap_candidates
+
+
+def greedy_pairs(rows, cols, iou):
+    """
+    one-to-one (row, col, iou) from candidate pairs, highest iou first and ties in (row, col) order
+    """
+    used_rows = set()
+    used_cols = set()
+    pairs = []
+    for k in np.lexsort((cols, rows, -iou)).tolist():
+        row = int(rows[k])
+        col = int(cols[k])
+        if row in used_rows or col in used_cols:
+            continue
+        used_rows.add(row)
+        used_cols.add(col)
+        pairs.append((row, col, float(iou[k])))
+    return pairs
+
+
+class BoxMatcher:
+    methods = ('greedy', 'hungarian')
+
+    def __init__(self, bbl, method='greedy', min_iou=0.5):
+        self.bbl = bbl
+        self.method = method
+        self.min_iou = min_iou
+        if method == 'hungarian' and linear_sum_assignment is None:
+            logging.warning("scipy is not installed, --match hungarian falls back to greedy")
+            self.method = 'greedy'
+
+    def match_groups(self, src, tgt):
+        """
+        one-to-one [(row, col, iou)] between (S,4) src and (T,4) tgt boxes, iou > 0 and >= min_iou only
+        """
+        if self.method == 'hungarian':
+            iou = iou_matrix(src, tgt)
+            iou[iou < self.min_iou] = 0
+            rows, cols = linear_sum_assignment(iou, maximize=True)
+            keep = (iou[rows, cols] > 0) & (iou[rows, cols] >= self.min_iou)
+            return list(zip(rows[keep].tolist(), cols[keep].tolist(), iou[rows[keep], cols[keep]].tolist()))
+
+        # greedy only looks at overlapping pairs, large groups skip the full matrix
+        if len(src) * len(tgt) > PRUNE_PAIRS:
+            rows, cols = overlap_candidates(src, tgt)
+            iou = iou_pairs(src[rows], tgt[cols])
+        else:
+            iou = iou_matrix(src, tgt)
+            rows, cols = np.nonzero(iou)
+            iou = iou[rows, cols]
+        keep = (iou > 0) & (iou >= self.min_iou)
+        return greedy_pairs(rows[keep], cols[keep], iou[keep])
+
+    def match_image(self, image):
+        """
+        returns (counts, match_iou): counts[class_base][user] holds tp/fp/fn against that class's
+        ref user, match_iou maps the store index of every matched user box to the iou of its pair
+        """
+        store = self.bbl.store
+        idx = self.bbl.bbox_obj_list[image].index_array()
+        counts = defaultdict(lambda: defaultdict(lambda: defaultdict(int)))
+        match_iou = {}
+        if not len(idx):
+            return counts, match_iou
+
+        groups = defaultdict(lambda: defaultdict(list))
+        keys = zip(store.codes['class_base'][idx].tolist(),
+                   store.codes['class_type'][idx].tolist(),
+                   store.codes['user'][idx].tolist())
+        for box, (class_base, class_type, user) in zip(idx.tolist(), keys):
+            groups[(class_base, class_type)][user].append(box)
+
+        users = self.bbl.stats.image_to_active_users_map[image]
+        for (base_code, _), user_groups in groups.items():
+            class_base = store.tables['class_base'].lookup(base_code)
+            ref_user = self.bbl.get_best_ref_user(image, class_base)
+            ref_idx = user_groups.get(store.user.codes.get(ref_user, -2), [])
+            for user in users:
+                if user == ref_user:
+                    continue
+                # a user without boxes in this group still misses every ref box
+                user_idx = user_groups.get(store.user.codes.get(user, -2), [])
+                pairs = []
+                if user_idx and ref_idx:
+                    pairs = self.match_groups(store.coords[user_idx].astype(np.int64),
+                                              store.coords[ref_idx].astype(np.int64))
+                for row, _, iou in pairs:
+                    match_iou[user_idx[row]] = iou
+                count = counts[class_base][user]
+                count['tp'] += len(pairs)
+                count['fp'] += len(user_idx) - len(pairs)
+                count['fn'] += len(ref_idx) - len(pairs)
+        return counts, match_iou
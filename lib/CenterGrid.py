@@ -0,0 +1,61 @@
+"""
+CenterGrid: uniform grid over box centers for rectangle queries
+
+centers are bucketed into square cells of about span/sqrt(n) once; a query only looks at the
+cells a rectangle overlaps and returns the positions whose center lies inside it (edges included),
+in ascending order so callers keep list order for tie breaks
+"""
+import math
+
+import numpy as np
+
+
+class CenterGrid:
+
+    def __init__(self, x, y, cell=None):
+        self.x = np.asarray(x, dtype=np.float64)
+        self.y = np.asarray(y, dtype=np.float64)
+        if len(self.x) == 0:
+            self.ncols = self.nrows = 0
+            return
+
+        self.x0 = self.x.min()
+        self.y0 = self.y.min()
+        if cell is None:
+            span = max(self.x.max() - self.x0, self.y.max() - self.y0, 1.0)
+            cell = max(span / math.sqrt(len(self.x)), 1.0)
+        self.cell = cell
+
+        cols = ((self.x - self.x0) // cell).astype(np.int64)
+        rows = ((self.y - self.y0) // cell).astype(np.int64)
+        self.ncols = int(cols.max()) + 1
+        self.nrows = int(rows.max()) + 1
+        cell_ids = rows * self.ncols + cols
+        # stable, so every cell holds its positions in ascending order
+        self.order = np.argsort(cell_ids, kind='stable')
+        self.starts = np.searchsorted(cell_ids[self.order], np.arange(self.ncols * self.nrows + 1))
+
+    def __len__(self):
+        return len(self.x)
+
+    def query(self, xmin, ymin, xmax, ymax):
+        """
+        ascending positions of the centers inside [xmin, xmax] x [ymin, ymax]
+        """
+        if self.ncols == 0:
+            return np.empty(0, dtype=np.int64)
+        c0 = max(int((xmin - self.x0) // self.cell), 0)
+        c1 = min(int((xmax - self.x0) // self.cell), self.ncols - 1)
+        r0 = max(int((ymin - self.y0) // self.cell), 0)
+        r1 = min(int((ymax - self.y0) // self.cell), self.nrows - 1)
+        if c0 > c1 or r0 > r1:
+            return np.empty(0, dtype=np.int64)
+
+        # the cells of one row are contiguous in the sorted order
+        parts = [self.order[self.starts[row * self.ncols + c0]:self.starts[row * self.ncols + c1 + 1]]
+                 for row in range(r0, r1 + 1)]
+        found = np.concatenate(parts) if len(parts) > 1 else parts[0]
+        x = self.x[found]
+        y = self.y[found]
+        inside = (xmin <= x) & (x <= xmax) & (ymin <= y) & (y <= ymax)
+        return np.sort(found[inside])
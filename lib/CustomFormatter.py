@@ -37,16 +37,21 @@ class CustomFormatter(logging.Formatter):
             logging.CRITICAL:  col['bold_red']  + fmta[types] + col['reset'],
         }
 
+    # one logging.Formatter per (type, level, color), built on first use
+    formatters = {}
+
     def __init__(self, type, color):
         self.type  = type
         self.color = color
 
     def format(self, record):
 
-        if self.color:
-            log_fmt = self.FORMATS[self.type].get(record.levelno)
-        else:
-            log_fmt = self.fmta[self.type]
-
-        formatter = logging.Formatter(log_fmt)
+        key = (self.type, record.levelno, self.color)
+        formatter = self.formatters.get(key)
+        if formatter is None:
+            if self.color:
+                log_fmt = self.FORMATS[self.type].get(record.levelno)
+            else:
+                log_fmt = self.fmta[self.type]
+            formatter = self.formatters.setdefault(key, logging.Formatter(log_fmt))
         return formatter.format(record)
@@ -0,0 +1,105 @@
+"""
+ImageMeta: image width and height per stem without decoding pixels
+
+the size comes from the SOF marker of the jpg header, the few segments before it are skipped
+by their length. when the jpg header can't be read the <size> element of the stem's first xml
+is used, and PIL only as a last resort. sizes are cached per stem for the whole run
+"""
+import logging
+import struct
+import xml.etree.ElementTree as ET
+
+from PIL import Image
+
+# start of frame markers carry the size, the other 0xC? markers do not
+SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+# markers without a length field
+STANDALONE_MARKERS = {0x01, *range(0xD0, 0xD8)}
+
+
+class ImageMeta:
+
+    def __init__(self, bbl):
+        self.bbl = bbl
+        self.sizes = {}
+        self.sources = {'jpg': 0, 'xml': 0, 'pil': 0}
+
+    def size(self, stem):
+        """
+        (width, height) of the stem's jpg
+        """
+        size = self.sizes.get(stem)
+        if size is not None:
+            return size
+
+        size = self.jpeg_size(self.bbl.stem2jpgs[stem])
+        source = 'jpg'
+        if size is None:
+            xmls = self.bbl.stem2xmls.get(stem)
+            size = self.xml_size(xmls[0]) if xmls else None
+            source = 'xml'
+        if size is None:
+            with Image.open(self.bbl.stem2jpgs[stem]) as ih:
+                size = ih.size
+            source = 'pil'
+        self.sources[source] += 1
+        logging.debug(f"image size of {stem} = {size} from {source}")
+        self.sizes[stem] = size
+        return size
+
+    @staticmethod
+    def jpeg_size(file_name):
+        """
+        (width, height) from the first SOF marker, None if file_name is not a readable jpg
+        """
+        try:
+            with open(file_name, 'rb') as f:
+                if f.read(2) != b'\xff\xd8':
+                    return None
+                while True:
+                    byte = f.read(1)
+                    if not byte:
+                        return None
+                    if byte != b'\xff':
+                        continue
+                    marker = f.read(1)
+                    # fill bytes before a marker
+                    while marker == b'\xff':
+                        marker = f.read(1)
+                    if not marker:
+                        return None
+                    code = marker[0]
+                    if code in STANDALONE_MARKERS or code == 0x00:
+                        continue
+                    if code == 0xD9 or code == 0xDA:
+                        # end of image or start of scan before any frame header
+                        return None
+                    length = f.read(2)
+                    if len(length) < 2:
+                        return None
+                    (length,) = struct.unpack('>H', length)
+                    if code in SOF_MARKERS:
+                        header = f.read(5)
+                        if len(header) < 5:
+                            return None
+                        _, height, width = struct.unpack('>BHH', header)
+                        return (width, height) if width and height else None
+                    f.seek(length - 2, 1)
+        except OSError as err:
+            logging.warning(f"can't read jpg header of {file_name}: {err}")
+            return None
+
+    @staticmethod
+    def xml_size(file_name):
+        """
+        (width, height) from the <size> element of a pascal voc xml, None if missing or unreadable
+        """
+        try:
+            for _, elem in ET.iterparse(file_name):
+                if elem.tag == 'size':
+                    width = int(elem.findtext('width', '0'))
+                    height = int(elem.findtext('height', '0'))
+                    return (width, height) if width and height else None
+        except (ET.ParseError, OSError, ValueError) as err:
+            logging.warning(f"can't read size from {file_name}: {err}")
+        return None
@@ -0,0 +1,198 @@
+"""
+batched iou computation: boxes of an image are grouped by (class_base, class_type, user)
+and every src group is compared against every tgt group with a single broadcast.
+large groups first prune to the overlapping pairs with a sort and sweep over xmin
+"""
+from collections import defaultdict
+import logging
+
+import numpy as np
+
+# iou of a box that overlaps nothing: -0.0 compares equal to 0 but is read back as the int 0
+# the scalar code returned, while a tiny overlap rounds to the float 0.0
+NO_OVERLAP = -0.0
+
+# src x tgt pairs above which a group pair is pruned instead of broadcast
+PRUNE_PAIRS = 4096
+
+
+def iou_matrix(src, tgt):
+    """
+    pairwise Intersection-over-Union between (S,4) src and (T,4) tgt boxes, returns (S,T)
+    same arithmetic as BboxList.compute_iou_bbox_pair so the values compare bit-exact
+    """
+    xmin_src, ymin_src, xmax_src, ymax_src = (src[:, i, None] for i in range(4))
+    xmin_tgt, ymin_tgt, xmax_tgt, ymax_tgt = (tgt[None, :, i] for i in range(4))
+
+    x_overlap = np.maximum(0, np.minimum(xmax_src, xmax_tgt) - np.maximum(xmin_src, xmin_tgt))
+    y_overlap = np.maximum(0, np.minimum(ymax_src, ymax_tgt) - np.maximum(ymin_src, ymin_tgt))
+    intersection = x_overlap * y_overlap
+
+    area_src = (xmax_src - xmin_src) * (ymax_src - ymin_src)
+    area_tgt = (xmax_tgt - xmin_tgt) * (ymax_tgt - ymin_tgt)
+    union = area_src + area_tgt - intersection
+
+    # degenerate boxes have no area at all: call that 0 instead of nan
+    iou = np.zeros(union.shape, dtype=np.float64)
+    np.divide(intersection, union, out=iou, where=union > 0)
+    return iou
+
+
+def last_running_max_rows(iou):
+    """
+    the scalar loop walks the tgt list for every src and records a tgt whenever it sets a new max.
+    for each tgt column return the last src row that did so (or -1), because that write wins
+    """
+    num_src, num_tgt = iou.shape
+    prev_max = np.zeros_like(iou)
+    if num_tgt > 1:
+        prev_max[:, 1:] = np.maximum.accumulate(iou, axis=1)[:, :-1]
+    is_new_max = iou > prev_max
+
+    last_row = num_src - 1 - np.argmax(is_new_max[::-1], axis=0)
+    last_row[~is_new_max.any(axis=0)] = -1
+    return last_row
+
+
+def overlap_candidates(src, tgt):
+    """
+    sort and sweep: (rows, cols) of the src/tgt pairs whose rectangles share a positive area,
+    ordered by row and then col. tgt is sorted on xmin once and every src only scans the
+    tgt window whose xmin lies in (xmin_src - widest tgt, xmax_src)
+    """
+    order = np.argsort(tgt[:, 0], kind='stable')
+    xmin_sorted = tgt[order, 0]
+    widest = max(int((tgt[:, 2] - tgt[:, 0]).max()), 0)
+    lo = np.searchsorted(xmin_sorted, src[:, 0] - widest, side='right')
+    hi = np.searchsorted(xmin_sorted, src[:, 2], side='left')
+    counts = np.maximum(hi - lo, 0)
+
+    rows = np.repeat(np.arange(len(src)), counts)
+    # position inside each row's window, then shift by the window start
+    starts = np.cumsum(counts) - counts
+    cols = order[np.arange(len(rows)) - np.repeat(starts - lo, counts)]
+
+    # the window only bounds xmin, drop the pairs apart in x before gathering whole boxes
+    near = tgt[cols, 2] > src[rows, 0]
+    rows = rows[near]
+    cols = cols[near]
+
+    s = src[rows]
+    t = tgt[cols]
+    overlap = ((np.minimum(s[:, 2], t[:, 2]) > np.maximum(s[:, 0], t[:, 0]))
+             & (np.minimum(s[:, 3], t[:, 3]) > np.maximum(s[:, 1], t[:, 1])))
+    rows = rows[overlap]
+    cols = cols[overlap]
+    keep = np.lexsort((cols, rows))
+    return rows[keep], cols[keep]
+
+
+def iou_pairs(src, tgt):
+    """
+    iou of row i of src with row i of tgt, same arithmetic as iou_matrix
+    """
+    x_overlap = np.maximum(0, np.minimum(src[:, 2], tgt[:, 2]) - np.maximum(src[:, 0], tgt[:, 0]))
+    y_overlap = np.maximum(0, np.minimum(src[:, 3], tgt[:, 3]) - np.maximum(src[:, 1], tgt[:, 1]))
+    intersection = x_overlap * y_overlap
+
+    area_src = (src[:, 2] - src[:, 0]) * (src[:, 3] - src[:, 1])
+    area_tgt = (tgt[:, 2] - tgt[:, 0]) * (tgt[:, 3] - tgt[:, 1])
+    union = area_src + area_tgt - intersection
+
+    iou = np.zeros(union.shape, dtype=np.float64)
+    np.divide(intersection, union, out=iou, where=union > 0)
+    return iou
+
+
+def last_running_max_pairs(rows, cols, iou, num_tgt):
+    """
+    last_running_max_rows for sparse pairs sorted by (row, col); pairs left out have iou 0 and
+    never set a new max. the running max restarts on every row: values are replaced by their
+    exact rank and offset by row, so one cumulative max over all pairs stays inside a row
+    """
+    last_row = np.full(num_tgt, -1, dtype=np.int64)
+    if not len(rows):
+        return last_row
+    _, rank = np.unique(iou, return_inverse=True)
+    span = int(rank.max()) + 2
+    key = rows.astype(np.int64) * span + rank + 1
+    prev = np.zeros_like(key)
+    prev[1:] = np.maximum.accumulate(key)[:-1]
+    # prev from an earlier row is below rows * span, which the first pair of a row always beats
+    is_new_max = key > prev
+    np.maximum.at(last_row, cols[is_new_max], rows[is_new_max])
+    return last_row
+
+
+class IouEngine:
+    def __init__(self, bbl):
+        self.bbl = bbl
+
+    def group_objects(self, store, idx):
+        """
+        positions into idx grouped by (class_base, class_type) and then user code
+        """
+        groups = defaultdict(lambda: defaultdict(list))
+        keys = zip(store.codes['class_base'][idx].tolist(),
+                   store.codes['class_type'][idx].tolist(),
+                   store.codes['user'][idx].tolist())
+        for pos, (class_base, class_type, user) in enumerate(keys):
+            groups[(class_base, class_type)][user].append(pos)
+        return groups
+
+    def compute_iou_for_image(self, image):
+        """
+        fill obj.iou[user] with the max iou against any box of that user (same class_base and class_type)
+        and obj.associated_user the same way compute_iou_obj_list does one pair at a time
+        """
+        store = self.bbl.store
+        idx = self.bbl.bbox_obj_list[image].index_array()
+        if not len(idx):
+            return
+        user_codes = [store.intern_user(user) for user in self.bbl.stats.user_list]
+        coords = store.coords[idx].astype(np.int64)
+
+        groups = self.group_objects(store, idx)
+        for class_key, user_groups in groups.items():
+            for src_user, src_pos in user_groups.items():
+                src_idx = idx[src_pos]
+                for user in user_codes:
+                    if user == src_user:
+                        continue
+                    tgt_pos = user_groups.get(user)
+                    if not tgt_pos:
+                        store.iou[src_idx, user] = NO_OVERLAP
+                        continue
+                    if len(src_pos) * len(tgt_pos) > PRUNE_PAIRS:
+                        row_max, last_row, last_iou = self.pruned_group_iou(coords[src_pos], coords[tgt_pos])
+                    else:
+                        iou = iou_matrix(coords[src_pos], coords[tgt_pos])
+                        row_max = iou.max(axis=1)
+                        last_row = last_running_max_rows(iou)
+                        last_iou = iou[last_row, np.arange(len(tgt_pos))]
+                    # python round, numpy rounds half-way cases differently
+                    store.iou[src_idx, user] = [round(value, 2) if value > 0 else NO_OVERLAP
+                                                for value in row_max.tolist()]
+
+                    cols = np.flatnonzero(last_row >= 0)
+                    tgt_idx = idx[tgt_pos]
+                    store.associated_user[tgt_idx[cols], src_user] = last_iou[cols]
+        logging.debug(f"iou engine: {len(idx)} boxes in {len(groups)} classes for {image}")
+
+    def pruned_group_iou(self, src, tgt):
+        """
+        row max, last_running_max_rows and the iou at those rows for iou_matrix(src, tgt),
+        evaluated on the overlapping pairs only
+        """
+        rows, cols = overlap_candidates(src, tgt)
+        iou = iou_pairs(src[rows], tgt[cols])
+        row_max = np.zeros(len(src), dtype=np.float64)
+        np.maximum.at(row_max, rows, iou)
+        last_row = last_running_max_pairs(rows, cols, iou, len(tgt))
+
+        # pairs are sorted by (row, col), find each (last_row, col) among them
+        last_iou = np.zeros(len(tgt), dtype=np.float64)
+        found = np.flatnonzero(last_row >= 0)
+        pair_keys = rows.astype(np.int64) * len(tgt) + cols
+        last_iou[found] = iou[np.searchsorted(pair_keys, last_row[found] * len(tgt) + found)]
+        return row_max, last_row, last_iou
@@ -0,0 +1,56 @@
+"""
+LogQueue: optional asynchronous logging
+
+the root logger only puts records on a queue and a QueueListener thread runs the real
+handlers, so writing debug.log never blocks the gui thread. parse worker processes get
+a QueueHandler on the same queue through the pool initializer
+"""
+import atexit
+import logging
+import logging.handlers
+import multiprocessing
+
+
+class LogQueue:
+    queue = None
+    listener = None
+
+    @classmethod
+    def start(cls, log):
+        """
+        move the handlers of log behind a listener thread, log itself only enqueues
+        """
+        handlers = list(log.handlers)
+        for handler in handlers:
+            log.removeHandler(handler)
+        cls.queue = multiprocessing.Queue(-1)
+        cls.listener = logging.handlers.QueueListener(cls.queue, *handlers, respect_handler_level=True)
+        log.addHandler(logging.handlers.QueueHandler(cls.queue))
+        cls.listener.start()
+        atexit.register(cls.stop)
+
+    @classmethod
+    def stop(cls):
+        """
+        flush what is queued and stop the listener
+        """
+        if cls.listener is not None:
+            cls.listener.stop()
+            cls.listener = None
+
+    @staticmethod
+    def init_worker(queue, level):
+        log = logging.getLogger()
+        for handler in list(log.handlers):
+            log.removeHandler(handler)
+        log.addHandler(logging.handlers.QueueHandler(queue))
+        log.setLevel(level)
+
+    @classmethod
+    def pool_args(cls):
+        """
+        ProcessPoolExecutor keywords that route worker logs to the listener, empty when logging is synchronous
+        """
+        if cls.queue is None:
+            return {}
+        return {'initializer': cls.init_worker, 'initargs': (cls.queue, logging.getLogger().level)}
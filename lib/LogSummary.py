@@ -0,0 +1,42 @@
+"""
+LogSummary: lazy, size-capped rendering of big structures in log messages
+
+pass it as a %-style logging argument so nothing is formatted unless a handler takes the record:
+
+    logging.debug("stem2files = %s", LogSummary(stem2files))
+
+maps and collections print their length and the first few items, nested ones are capped too
+"""
+from collections.abc import Mapping, Collection
+from itertools import islice
+
+
+class LogSummary:
+    __slots__ = ('obj', 'limit', 'width')
+
+    def __init__(self, obj, limit=5, width=120):
+        self.obj = obj
+        self.limit = limit
+        self.width = width
+
+    def __str__(self):
+        return self.summarize(self.obj, depth=0)
+
+    def summarize(self, obj, depth):
+        if not isinstance(obj, Collection) or isinstance(obj, (str, bytes)):
+            text = repr(obj)
+            return text if len(text) <= self.width else text[:self.width] + "..."
+        if depth > 2:
+            return f"<{type(obj).__name__} of {len(obj)}>"
+
+        if isinstance(obj, Mapping):
+            items = [f"{self.summarize(key, depth + 1)}: {self.summarize(value, depth + 1)}"
+                     for key, value in islice(obj.items(), self.limit)]
+            brackets = "{}"
+        else:
+            items = [self.summarize(value, depth + 1) for value in islice(obj, self.limit)]
+            brackets = "[]" if isinstance(obj, (list, tuple)) else "{}"
+        more = len(obj) - len(items)
+        if more > 0:
+            items.append(f"... +{more} more")
+        return f"{type(obj).__name__}({len(obj)}) {brackets[0]}{', '.join(items)}{brackets[1]}"
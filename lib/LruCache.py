@@ -0,0 +1,65 @@
+"""
+LruCache: least recently used cache bounded by a byte budget
+
+values are sized with the sizeof callable given at construction, the oldest entries
+are evicted until the total fits max_bytes again. a single value larger than the
+budget is not stored at all
+"""
+from collections import OrderedDict
+import logging
+
+
+class LruCache:
+
+    def __init__(self, name, max_bytes, sizeof=len):
+        self.name = name
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        self.entries = OrderedDict()
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def get(self, key, default=None):
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return default
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return entry[0]
+
+    def put(self, key, value):
+        size = self.sizeof(value)
+        self.pop(key)
+        if size > self.max_bytes:
+            logging.debug(f"{self.name} cache: {size} bytes over budget of {self.max_bytes}, not stored")
+            return
+        self.entries[key] = (value, size)
+        self.nbytes += size
+        while self.nbytes > self.max_bytes:
+            _, (_, old_size) = self.entries.popitem(last=False)
+            self.nbytes -= old_size
+            self.evictions += 1
+
+    def pop(self, key):
+        entry = self.entries.pop(key, None)
+        if entry is None:
+            return None
+        self.nbytes -= entry[1]
+        return entry[0]
+
+    def clear(self):
+        self.entries.clear()
+        self.nbytes = 0
+
+    def log_stats(self):
+        logging.info(f"{self.name} cache: {len(self.entries)} entries {self.nbytes} bytes "
+                     f"{self.hits} hits {self.misses} misses {self.evictions} evicted")
@@ -0,0 +1,153 @@
+"""
+ParseCache: on-disk cache of parse_xml_records results and of jpg hashes
+
+one sqlite file holds the pickled boxes of every xml, keyed by absolute path and check level,
+and the head/tail and sha256 hashes of jpg files used by the clash check.
+an entry is reused only while the file's mtime and size are unchanged, so delivered (immutable)
+annotation folders are parsed once and then only stat'ed on every launch.
+boxes are kept as (class_base, class_type, difficult, bbox) without the dir and file of the record,
+those follow how --data is spelled and are rebuilt from the path being read
+"""
+import logging
+import os
+import pickle
+import sqlite3
+import threading
+from pathlib import Path
+
+
+class ParseCache:
+
+    # bump when the record layout changes, older rows are then ignored
+    FORMAT = 2
+
+    def __init__(self, cache_dir, check_level):
+        self.check_level = check_level
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        # entries queued by put(), written in one transaction by flush()
+        self.pending = []
+        self.lock = threading.Lock()
+
+        Path(cache_dir).mkdir(parents=True, exist_ok=True)
+        self.path = os.path.join(cache_dir, "parse_cache.sqlite")
+        self.db = sqlite3.connect(self.path, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute("""
+            CREATE TABLE IF NOT EXISTS xml (
+                path     TEXT    NOT NULL,
+                check_level TEXT NOT NULL,
+                format   INTEGER NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                size     INTEGER NOT NULL,
+                records  BLOB    NOT NULL,
+                PRIMARY KEY (path, check_level)
+            )""")
+        self.db.execute("""
+            CREATE TABLE IF NOT EXISTS file_hash (
+                path     TEXT    PRIMARY KEY,
+                mtime_ns INTEGER NOT NULL,
+                size     INTEGER NOT NULL,
+                head     TEXT,
+                sha256   TEXT
+            )""")
+        self.db.commit()
+        logging.info(f"parse cache: {self.path}")
+
+    @staticmethod
+    def get_default_dir():
+        return os.path.join(Path.home(), ".cache", "compare_image_annotations")
+
+    @staticmethod
+    def stat_key(file):
+        st = os.stat(file)
+        return st.st_mtime_ns, st.st_size
+
+    def get(self, file):
+        """
+        returns (boxes, stat_key), boxes is None unless a matching entry exists
+        """
+        path = os.path.abspath(file)
+        key = self.stat_key(file)
+        with self.lock:
+            row = self.db.execute(
+                "SELECT format, mtime_ns, size, records FROM xml WHERE path=? AND check_level=?",
+                (path, self.check_level)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None, key
+            if (row[0], row[1], row[2]) != (self.FORMAT, *key):
+                self.invalidations += 1
+                return None, key
+            self.hits += 1
+        return pickle.loads(row[3]), key
+
+    def put_many(self, entries):
+        """
+        store [(file, stat_key, boxes)] in one transaction
+        """
+        rows = [(os.path.abspath(file), self.check_level, self.FORMAT, key[0], key[1],
+                 pickle.dumps(boxes, protocol=pickle.HIGHEST_PROTOCOL))
+                for file, key, boxes in entries]
+        if not rows:
+            return
+        with self.lock:
+            self.db.executemany("INSERT OR REPLACE INTO xml VALUES (?, ?, ?, ?, ?, ?)", rows)
+            self.db.commit()
+
+    def put(self, file, stat_key, boxes):
+        """
+        queue one entry for the next flush()
+        """
+        with self.lock:
+            self.pending.append((file, stat_key, boxes))
+
+    def flush(self):
+        with self.lock:
+            entries, self.pending = self.pending, []
+        self.put_many(entries)
+
+    def get_hashes(self, file, key):
+        """
+        returns (head, sha256) stored for file while its stat key is unchanged, either may be None
+        """
+        with self.lock:
+            row = self.db.execute(
+                "SELECT mtime_ns, size, head, sha256 FROM file_hash WHERE path=?",
+                (os.path.abspath(file),)).fetchone()
+        if row is None or (row[0], row[1]) != key:
+            return None, None
+        return row[2], row[3]
+
+    def put_hashes(self, entries):
+        """
+        store [(file, stat_key, head, sha256)] in one transaction
+        """
+        rows = [(os.path.abspath(file), key[0], key[1], head, sha256) for file, key, head, sha256 in entries]
+        if not rows:
+            return
+        with self.lock:
+            self.db.executemany("INSERT OR REPLACE INTO file_hash VALUES (?, ?, ?, ?, ?)", rows)
+            self.db.commit()
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'invalidations': self.invalidations}
+
+    def add_stats(self, stats):
+        """
+        fold in the counts of another process's cache, see stats()
+        """
+        with self.lock:
+            self.hits += stats['hits']
+            self.misses += stats['misses']
+            self.invalidations += stats['invalidations']
+
+    def log_stats(self):
+        logging.info(f"parse cache: {self.hits} hits {self.misses} misses {self.invalidations} invalidated")
+
+    def close(self):
+        self.flush()
+        with self.lock:
+            self.db.close()
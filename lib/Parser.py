@@ -7,14 +7,16 @@ from xml.etree import ElementTree
 from xml.etree.ElementTree import Element, SubElement
 from lxml import etree
 import codecs
-from pathlib import Path
+from pathlib import Path, PureWindowsPath
 
 from collections import Counter
-from collections import defaultdict
+from collections import defaultdict, namedtuple
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from datetime import datetime
 from glob import glob
-import filecmp
+import hashlib
 import logging
+import time
 import psutil
 from colorama import Fore, Back, Style
 
@@ -24,18 +26,34 @@ from libs.build_stamp import *
 XML_EXT = '.xml'
 ENCODE_METHOD = DEFAULT_ENCODING
 
-from lib.Bbox       import Bbox
 from libs.plantData import plantData
+from lib.ParseCache import ParseCache
+from lib.ImageMeta import ImageMeta
+from lib.LogSummary import LogSummary
+from lib.ProcessPool import pool_map
+
+# what a parse worker sends back for each box: picklable and laid out like the Bbox constructor
+BoxRecord = namedtuple('BoxRecord', 'dir file image class_base class_type difficult bbox')
 
 class Parser:
-    def __init__(self, bbl, args) :
+    def __init__(self, bbl, args, scan=True) :
         xml_ext = ".xml"
         jpg_ext = ".jpg"
         self.bbl = bbl
         self.args = args
 
-        self.bbl.stem2xmls = self.get_files_with_mutiple_versions(args.data, xml_ext, args.prune)
-        self.bbl.stem2jpgs = self.get_files_with_mutiple_versions(args.data, jpg_ext, False     )
+        self.chunk_size = 64
+        self.scan = scan
+        self.cache = None
+        if not args.no_cache:
+            self.cache = ParseCache(args.cache or ParseCache.get_default_dir(), args.check)
+        # worker processes get the scan results from the main process (BboxList.run_state)
+        if not scan:
+            return
+
+        stem2files = self.discover_files(args.data, [xml_ext, jpg_ext])
+        self.bbl.stem2xmls = self.get_files_with_mutiple_versions(stem2files[xml_ext], xml_ext, args.prune)
+        self.bbl.stem2jpgs = self.get_files_with_mutiple_versions(stem2files[jpg_ext], jpg_ext, False     )
 
         self.ignore_jpg_with_no_associated_xml();
         self.ignore_xml_with_no_associated_jpg();
@@ -46,26 +64,26 @@ class Parser:
 
     def ignore_jpg_with_no_associated_xml(self):
 
-        valid_images = list(self.bbl.stem2xmls.keys())
+        valid_images = set(self.bbl.stem2xmls.keys())
 
         remove_keys = []
         for image in self.bbl.stem2jpgs.keys():
             if not image in valid_images:
                 remove_keys.append(image)
-        logging.debug(f"removing keys {remove_keys=}")
+        logging.debug("removing keys remove_keys=%s", LogSummary(remove_keys))
         for key in remove_keys:
             #logging.warning(" {key}: missing jpg for {self.bbl.stem2jpgs[key]}")
             self.bbl.stem2jpgs.pop(key)
 
     def ignore_xml_with_no_associated_jpg(self):
 
-        valid_images = list(self.bbl.stem2jpgs.keys())
+        valid_images = set(self.bbl.stem2jpgs.keys())
 
         remove_keys = []
         for image in self.bbl.stem2xmls.keys():
             if not image in valid_images:
                 remove_keys.append(image)
-        logging.debug(f"removing keys {remove_keys=}")
+        logging.debug("removing keys remove_keys=%s", LogSummary(remove_keys))
         for key in remove_keys:
             logging.warning(f" missing {key}.jpg : skipping {self.bbl.stem2xmls[key]}")
             self.bbl.stem2xmls.pop(key)
@@ -81,29 +99,94 @@ class Parser:
         for file in self.bbl.stem2xmls[image]:
             bbox_list = self.parse_xml_file(image, file, self.args.check)
             self.bbl.bbox_obj_list[image].extend(bbox_list)
-            print(f" -> loaded {col_box} {len(bbox_list)} {col_reset} boxes from {file}")
+            if not (self.args.batch or self.args.report or self.args.plot):
+                print(f" -> loaded {col_box} {len(bbox_list)} {col_reset} boxes from {file}")
+        # one write per image here, pool workers write once per chunk when worker_bbl closes the cache
+        if self.cache is not None and self.scan:
+            self.cache.flush()
 
 
-    def get_files_with_mutiple_versions(self, root_dir, ext, prune):
+    @staticmethod
+    def scan_dir(dir, exts):
         """
-        same xml or jpg has more than 1 version
+        one os.scandir listing: files matching exts as [(ext, stem, path)] and the subdirs, in listing order
         """
         files = []
-        stem2files = defaultdict(list)
-        for rdir in root_dir:
-            for dir, _, files in os.walk(rdir, followlinks=True):
-                for file in files:
-                    if file.endswith(ext): 
-                        filename = os.path.join(dir, file)
-                        stem = Path(filename).stem
-                        stem2files[stem].append(filename)
-        logging.debug(f"for {ext=} {stem2files=}")
+        subdirs = []
+        try:
+            with os.scandir(dir) as it:
+                for entry in it:
+                    try:
+                        is_dir = entry.is_dir()
+                    except OSError:
+                        is_dir = False
+                    if is_dir:
+                        subdirs.append(entry.path)
+                        continue
+                    for ext in exts:
+                        if entry.name.endswith(ext):
+                            files.append((ext, os.path.splitext(entry.name)[0], entry.path))
+                            break
+        except OSError as err:
+            # os.walk skips unreadable dirs too
+            logging.warning(f"cannot scan {dir}: {err}")
+        return files, subdirs
+
+    def discover_files(self, root_dirs, exts):
+        """
+        find files with any of exts under all root_dirs in one pass, returns stem2files per ext.
+        directories are listed concurrently in a thread pool (network shares are latency bound),
+        then results are put back in os.walk(followlinks=True) order so stem lists stay stable
+        """
+        listing = {}
+        pending = {}
+        root_done = {}
+        start = time.perf_counter()
+        workers = min(32, 4 * (os.cpu_count() or 1))
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = {}
+            for root in dict.fromkeys(root_dirs):
+                pending[root] = 1
+                futures[pool.submit(self.scan_dir, root, exts)] = (root, root)
+            while futures:
+                done, _ = wait(futures, return_when=FIRST_COMPLETED)
+                for future in done:
+                    root, dir = futures.pop(future)
+                    files, subdirs = future.result()
+                    listing[dir] = (files, subdirs)
+                    pending[root] += len(subdirs) - 1
+                    for subdir in subdirs:
+                        futures[pool.submit(self.scan_dir, subdir, exts)] = (root, subdir)
+                    if pending[root] == 0:
+                        root_done[root] = time.perf_counter() - start
+
+        stem2files = {ext: defaultdict(list) for ext in exts}
+        for root in root_dirs:
+            num_dirs = num_files = 0
+            stack = [root]
+            while stack:
+                dir = stack.pop()
+                files, subdirs = listing[dir]
+                num_dirs += 1
+                num_files += len(files)
+                for ext, stem, path in files:
+                    stem2files[ext][stem].append(path)
+                stack.extend(reversed(subdirs))
+            logging.info(f"discovery: {root} {num_dirs} dirs {num_files} files in {root_done[root]:.2f}s")
+        logging.info(f"discovery: {len(listing)} dirs in {time.perf_counter() - start:.2f}s")
+        return stem2files
+
+    def get_files_with_mutiple_versions(self, stem2files, ext, prune):
+        """
+        same xml or jpg has more than 1 version
+        """
+        logging.debug("for ext=%r stem2files=%s", ext, LogSummary(stem2files))
 
         # remove entries with only 1 xml
         if prune:
             stem2files = dict(filter(lambda elem: len(elem[1]) > 1, stem2files.items()))
 
-        logging.info(f"{prune} : {stem2files}")
+        logging.info("%s : %s", prune, LogSummary(stem2files))
 
         #sys.exit(0)
         return stem2files
@@ -139,66 +222,291 @@ class Parser:
         get the object in each jpg file under jpg_path
         """
         err_exit = False
-        image_list = self.bbl.stats.image_list
+        image_list = set(self.bbl.stats.image_list)
+        copies = {}
         for stem, files in self.bbl.stem2jpgs.items():
             if stem in image_list:
                 self.bbl.stem2jpgs[stem] = files[0]
                 if len(files) > 1:
-                    for file in files[1:]:
-                        if not filecmp.cmp(files[0], file):
-                            logging.error(f"clash between multiple jpg files that are not the same: ")
-                            logging.error(f"clash     {files[0]}")
-                            logging.error(f"clash     {file}")
-                            err_exit = True
+                    copies[stem] = files
+
+        for stem, first, file in self.find_jpg_clashes(copies):
+            logging.error(f"clash between multiple jpg files that are not the same: ")
+            logging.error(f"clash     {first}")
+            logging.error(f"clash     {file}")
+            err_exit = True
 
         if err_exit:
             sys.exit(-1)
-        logging.debug(self.bbl.stem2jpgs)
+        logging.debug("%s", LogSummary(self.bbl.stem2jpgs))
 
-    def fix_labels(self, file, text):
+    def find_jpg_clashes(self, copies):
+        """
+        [(stem, first, file)] for every copy that differs from the first jpg of its stem
+        cheapest test first: sizes, then a hash of the head and tail blocks, a full sha256 only on ties.
+        hashes come from the cache or the xml next to the jpg when possible and are computed in threads.
+        a sha256 from the xml only saves the full read, head and tail are always compared
         """
-        fix common problems with labels!
+        start = time.perf_counter()
+        stat = {file: ParseCache.stat_key(file) for files in copies.values() for file in files}
+        head = {}
+        sha256 = {}
+        for stem, files in copies.items():
+            for file in files:
+                if self.cache is not None:
+                    head[file], sha256[file] = self.cache.get_hashes(file, stat[file])
+                if sha256.get(file) is None:
+                    sha256[file] = self.image_sha256_from_xml(stem, file)
+        known = {file for file, value in sha256.items() if value is not None}
+
+        pairs = [(stem, files[0], file) for stem, files in copies.items() for file in files[1:]]
+        same_size = [pair for pair in pairs if stat[pair[1]][1] == stat[pair[2]][1]]
+
+        with ThreadPoolExecutor() as pool:
+            def fill(values, files, hasher):
+                todo = sorted({file for file in files if values.get(file) is None})
+                values.update(zip(todo, pool.map(hasher, todo)))
+                return todo
+
+            new_head = fill(head, [file for pair in same_size for file in pair[1:]], self.head_tail_hash)
+            # copies whose full hash is known already are settled without reading them
+            ties = [pair for pair in same_size if head[pair[1]] == head[pair[2]]]
+            new_sha256 = fill(sha256, [file for pair in ties for file in pair[1:]], self.sha256sum)
+
+        def differs(pair):
+            _, first, file = pair
+            if stat[first][1] != stat[file][1] or head[first] != head[file]:
+                return True
+            return sha256[first] != sha256[file]
+
+        clashes = [pair for pair in pairs if differs(pair)]
+
+        if self.cache is not None:
+            updated = sorted(set(new_head) | set(new_sha256) | known)
+            self.cache.put_hashes([(file, stat[file], head.get(file), sha256.get(file)) for file in updated])
+
+        elapsed = time.perf_counter() - start
+        logging.info(f"jpg clash check: {len(stat)} files, {len(new_head)} head and {len(new_sha256)} full hashes"
+                     f" computed, {len(known)} known in {elapsed:.3f}s")
+        return clashes
+
+    @staticmethod
+    def head_tail_hash(filename, bufsize=64 * 1024):
+        """
+        sha256 of the size, first and last block: different for nearly all distinct jpgs of the same size
         """
-        text = text.lower()
-        basename = Path(file).name
-        if '-' in text:
-            out = text.replace('-','_')
-            logging.info(f" {basename}: replaced dash so {text} -> {out}")
-            text = out
+        h = hashlib.sha256()
+        with open(filename, 'rb', buffering=0) as f:
+            size = os.fstat(f.fileno()).st_size
+            h.update(str(size).encode())
+            h.update(f.read(bufsize))
+            if size > bufsize:
+                f.seek(max(bufsize, size - bufsize))
+                h.update(f.read(bufsize))
+        return h.hexdigest()
 
-        if ' ' in text:
-            out = text.replace(' ','_')
-            logging.info(f" {basename}: replaced space so {text} -> {out}")
-            text = out
+    def image_sha256_from_xml(self, stem, jpg):
+        """
+        image_sha256 written by PascalVocWriter in an xml next to the jpg, trusted only if the jpg
+        has not been touched since that xml was saved and the xml still describes this file: its
+        filename and path name the jpg, its <size> matches the jpg header and its image_bytes the
+        file size. a jpg replaced with its mtime kept (cp -p, rsync -a) is then hashed after all
+        """
+        jpg_dir = os.path.dirname(jpg)
+        jpg_name = os.path.basename(jpg)
+        for xml in self.bbl.stem2xmls.get(stem, []):
+            if os.path.dirname(xml) != jpg_dir:
+                continue
+            try:
+                jpg_stat = os.stat(jpg)
+                if os.stat(xml).st_mtime_ns < jpg_stat.st_mtime_ns:
+                    continue
+                header = self.xml_header(xml)
+            except (OSError, ElementTree.ParseError):
+                continue
+            if header.get('image_sha256') is None or header.get('filename') != jpg_name:
+                continue
+            # path is written on windows too, PureWindowsPath splits on either separator
+            if header.get('path') is not None and PureWindowsPath(header['path']).name != jpg_name:
+                continue
+            if header.get('image_bytes') != str(jpg_stat.st_size):
+                continue
+            size = ImageMeta.jpeg_size(jpg)
+            if size is None or (header.get('width'), header.get('height')) != tuple(map(str, size)):
+                continue
+            return header['image_sha256']
+        return None
+
+    @staticmethod
+    def xml_header(xml):
+        """
+        {tag: text} of the header fields of an xml written by PascalVocWriter, <size> as width and height
+        """
+        tags = {'filename', 'path', 'image_sha256', 'image_bytes', 'width', 'height'}
+        header = {}
+        for _, elem in ElementTree.iterparse(xml):
+            if elem.tag == 'object':
+                # header fields come before the boxes
+                break
+            if elem.tag in tags and elem.text is not None:
+                header[elem.tag] = elem.text.strip()
+        return header
 
-        if '_meristem' in text:
-            out = text.replace('_meristem','_stem')
-            #logging.info(f" {basename}: replaced meristem so {text} -> {out}")
-            text = out
+    def fix_labels(self, file, text):
+        return fix_labels(file, text)
 
-        if not plantData.has_valid_suffix(text):
-            out = text + "_outer"
-            logging.info(f" {basename}: missing valid type suffix so assuming {text} -> {out}")
-            text = out
+    def collapse_class_names(self, class_base):
+        return collapse_class_names(class_base)
 
-        if text not in plantData.planttype_names:
-            logging.warning(f" {basename}: label {text} not in standard label types: {plantData.planttype_names}")
+    def parse_xml_file(self, stem, file_path, check_level):
+        """
+        parse one xml and add its boxes to the store, returns the list of views
+        """
+        records = None
+        if self.cache is not None:
+            boxes, key = self.cache.get(file_path)
+            if boxes is not None:
+                records = records_from_boxes(stem, file_path, boxes)
+        if records is None:
+            records = parse_xml_records(stem, file_path, check_level)
+            if self.cache is not None:
+                self.cache.put(file_path, key, boxes_from_records(records))
+        return [self.bbl.store.add(*record) for record in records]
+
+    def cache_stats(self):
+        """
+        parse cache counts of this process (picklable, for pool workers to send back), None without a cache
+        """
+        return None if self.cache is None else self.cache.stats()
 
-        return text
+    def add_cache_stats(self, stats):
+        if self.cache is not None and stats is not None:
+            self.cache.add_stats(stats)
 
-    def collapse_class_names(self, class_base):
+    def log_cache_stats(self):
+        if self.cache is not None:
+            self.cache.log_stats()
+
+    def iter_parse_stems(self, stems, jobs=1):
+        """
+        parse all xml of stems in a process pool, chunk_size stems per task.
+        boxes are added to bbl.bbox_obj_list in stem order and each stem is yielded once it is in;
+        at most 2 * jobs chunks are in flight so memory stays flat on big datasets
+        """
+        check_level = self.args.check
+        stems = list(stems)
+        chunks = []
+        for i in range(0, len(stems), self.chunk_size):
+            chunk_stems = stems[i:i + self.chunk_size]
+            chunks.append([(stem, self.bbl.stem2xmls[stem]) for stem in chunk_stems])
+
+        def tasks():
+            # cache lookups run as chunks are submitted, fully cached chunks never reach the pool
+            for chunk in chunks:
+                hits, todo = self.lookup_cached_chunk(chunk)
+                yield (chunk, hits), (todo, check_level) if todo else None
+
+        for (chunk, hits), parsed in pool_map(parse_xml_chunk, tasks(), jobs if len(chunks) > 1 else 1):
+            yield from self.add_parsed_chunk(self.merge_cached_chunk(chunk, hits, parsed or []))
+
+    def lookup_cached_chunk(self, chunk):
         """
-        easy mode
+        split a chunk into cached records {file: (stat_key, records)} and [(stem, files)] still to parse
         """
-        known_types = "carrot spinach unknown".split()
-        for type in known_types:
-            if type in class_base:
-                return type
+        hits = {}
+        todo = []
+        for stem, files in chunk:
+            missing = []
+            for file in files:
+                if self.cache is None:
+                    missing.append(file)
+                    continue
+                boxes, key = self.cache.get(file)
+                if boxes is None:
+                    hits[file] = (key, None)
+                    missing.append(file)
+                else:
+                    hits[file] = (key, records_from_boxes(stem, file, boxes))
+            if missing:
+                todo.append((stem, missing))
+        return hits, todo
 
-        # not a known type? must be a weed
-        return 'weed'
+    def merge_cached_chunk(self, chunk, hits, parsed):
+        """
+        put freshly parsed files in the cache and return all results in chunk order
+        """
+        parsed_records = {file: records for _, file, records in parsed}
+        if self.cache is not None:
+            self.cache.put_many([(file, hits[file][0], boxes_from_records(records))
+                                 for file, records in parsed_records.items()])
+        results = []
+        for stem, files in chunk:
+            for file in files:
+                if file in parsed_records:
+                    results.append((stem, file, parsed_records[file]))
+                else:
+                    results.append((stem, file, hits[file][1]))
+        return results
 
-    def parse_xml_file(self, stem, file_path, check_level):
+    def add_parsed_chunk(self, results):
+        """
+        move worker records into the store, yield each stem when all its files are added
+        """
+        last_stem = None
+        for stem, file, records in results:
+            if last_stem is not None and stem != last_stem:
+                yield last_stem
+            last_stem = stem
+            self.bbl.bbox_obj_list[stem].extend([self.bbl.store.add(*record) for record in records])
+        if last_stem is not None:
+            yield last_stem
+
+
+def fix_labels(file, text):
+    """
+    fix common problems with labels!
+    """
+    text = text.lower()
+    basename = os.path.basename(file)
+    if '-' in text:
+        out = text.replace('-','_')
+        logging.info(f" {basename}: replaced dash so {text} -> {out}")
+        text = out
+
+    if ' ' in text:
+        out = text.replace(' ','_')
+        logging.info(f" {basename}: replaced space so {text} -> {out}")
+        text = out
+
+    if '_meristem' in text:
+        out = text.replace('_meristem','_stem')
+        #logging.info(f" {basename}: replaced meristem so {text} -> {out}")
+        text = out
+
+    if not plantData.has_valid_suffix(text):
+        out = text + "_outer"
+        logging.info(f" {basename}: missing valid type suffix so assuming {text} -> {out}")
+        text = out
+
+    if text not in plantData.planttype_names:
+        logging.warning(f" {basename}: label {text} not in standard label types: {plantData.planttype_names}")
+
+    return text
+
+def collapse_class_names(class_base):
+    """
+    easy mode
+    """
+    known_types = "carrot spinach unknown".split()
+    for type in known_types:
+        if type in class_base:
+            return type
+
+    # not a known type? must be a weed
+    return 'weed'
+
+
+def parse_xml_records(stem, file_path, check_level):
 #    """
 #    parse xml file that looks like:
 #
@@ -229,62 +537,87 @@ class Parser:
 #        </object>
 #
 #    """
-        parser = etree.XMLParser(encoding=ENCODE_METHOD)
-        root = ElementTree.parse(file_path, parser=parser).getroot()
-        filename = root.find('filename').text
-        bbox_list = []
-
-        image    = stem
-        img_size = root.find('size')
-
-        attr = "username timestamp image_sha256 xmlpath path folder".split()
+    parser = etree.XMLParser(encoding=ENCODE_METHOD)
+    root = ElementTree.parse(file_path, parser=parser).getroot()
+    filename = root.find('filename').text
+    bbox_list = []
+
+    image    = stem
+    img_size = root.find('size')
+    dir      = str(Path(file_path).parent)
+
+    attr = "username timestamp image_sha256 xmlpath path folder".split()
+    for key in attr:
+        if root.find(key) is not None:
+            value = root.find(key).text
+        else:
+            value = None
+        #setattr(self.filestats, key, value)
+
+
+    objects  = root.findall('object')
+    bboxes = defaultdict(lambda: defaultdict(list))
+    for obj in objects:
+        class_name = obj.find('name').text
+        class_name = fix_labels(file_path, class_name)
+        difficult = int(obj.find('difficult').text)
+
+        attr = "note user".split()
         for key in attr:
-            if root.find(key) is not None:
-                value = root.find(key).text
+            if obj.find(key) is not None:
+                value = obj.find(key).text
             else:
                 value = None
             #setattr(self.filestats, key, value)
 
 
-        objects  = root.findall('object')
-        bboxes = defaultdict(lambda: defaultdict(list))
-        for obj in objects:
-            class_name = obj.find('name').text
-            class_name = self.fix_labels(file_path, class_name)
-            difficult = int(obj.find('difficult').text)
+        bbox = obj.find('bndbox')
+        xmin = int(bbox.find('xmin').text)
+        ymin = int(bbox.find('ymin').text)
+        xmax = int(bbox.find('xmax').text)
+        ymax = int(bbox.find('ymax').text)
 
-            attr = "note user".split()
-            for key in attr:
-                if obj.find(key) is not None:
-                    value = obj.find(key).text
-                else:
-                    value = None
-                #setattr(self.filestats, key, value)
+        class_base, class_type_name = plantData.split_name_into_plant_and_type(class_name)
 
+        if class_type_name != 'outer' and class_type_name != 'stem':     
+            logging.error(f"class name should end in _outer or _stem: {class_name}")
+            logging.error(f"look at file: {file_path}")
+        else:
+            class_type = class_type_name
+            if class_type_name == "stem":
+                class_type = "inner"
 
-            bbox = obj.find('bndbox')
-            xmin = int(bbox.find('xmin').text)
-            ymin = int(bbox.find('ymin').text)
-            xmax = int(bbox.find('xmax').text)
-            ymax = int(bbox.find('ymax').text)
+            if check_level == "relaxed": 
+                class_base = collapse_class_names(class_base)
 
-            class_base, class_type_name = plantData.split_name_into_plant_and_type(class_name)
+            record = BoxRecord(dir, file_path, image,  class_base, class_type, difficult, (xmin, ymin, xmax, ymax))
+            bbox_list.append(record)
+
+    return bbox_list
+
+
+def boxes_from_records(records):
+    """
+    what ParseCache keeps of records: only what comes from the xml's content, the paths come from
+    however --data is spelled and are filled in again by records_from_boxes
+    """
+    return [(record.class_base, record.class_type, record.difficult, record.bbox) for record in records]
+
+
+def records_from_boxes(stem, file_path, boxes):
+    dir = str(Path(file_path).parent)
+    return [BoxRecord(dir, file_path, stem, *box) for box in boxes]
 
-            if class_type_name != 'outer' and class_type_name != 'stem':     
-                logging.error(f"class name should end in _outer or _stem: {class_name}")
-                logging.error(f"look at file: {file}")
-            else:
-                class_type = class_type_name
-                if class_type_name == "stem":
-                    class_type = "inner"
 
-                if check_level == "relaxed": 
-                    class_base = self.collapse_class_names(class_base)
+def parse_xml_chunk(chunk, check_level):
+    """
+    worker side of the parse pool: [(stem, files)] -> [(stem, file, records)]
+    """
+    results = []
+    for stem, files in chunk:
+        for file in files:
+            results.append((stem, file, parse_xml_records(stem, file, check_level)))
+    return results
 
-                dir = str(Path(file_path).parent)
-                bbox = Bbox(dir, file_path, image,  class_base, class_type, difficult, [xmin, ymin, xmax, ymax])
-                bbox_list.append(bbox)
 
-        return bbox_list
 
-    
@@ -6,17 +6,21 @@
 #
 ###########################################################################################
 
+import os
 import sys
-from collections import defaultdict, OrderedDict
-from PIL import Image, ImageDraw, ImageFont, ImageEnhance
+from collections import defaultdict, OrderedDict, namedtuple
+from PIL import Image, ImageDraw, ImageFont
 from os.path import exists, join, isdir, isfile,  dirname, abspath
 import logging
-import io
 import math
+import numpy as np
 from random import choice, randint
 
 from lib.Bbox   import Bbox, DeepDict
 from lib.ColorPalette import ColorPalette
+from lib.LruCache import LruCache
+from lib.LogSummary import LogSummary
+from lib.ProcessPool import pool_map, worker_bbl
 
 
 import pudb
@@ -53,6 +57,16 @@ class DrawObject(object):
 
         return True
 
+    def key(self):
+        """
+        hashable form of the fields that change the rendered overlay
+        adjust_background and adjust_foreground are applied by the canvas and overlay_stats is an output,
+        they are left out
+        """
+        return (self.image, self.class_base, self.ref_user,
+                tuple(self.visible_types.items()), tuple(self.active_users), tuple(self.visible_users.items()),
+                self.iou_filter_value, self.color_theme)
+
     def __repr__(self):
         items = (f"{k}={v!r}" for k, v in self.__dict__.items())
         return "{}({})".format(type(self).__name__, ", ".join(items))
@@ -60,7 +74,36 @@ class DrawObject(object):
     def __str__(self):
         return f"i={self.image} c={self.class_base} ru={self.ref_user} vt={self.visible_types} vu={self.visible_users} cs={self.color_theme} fv={self.iou_filter_value} ab={self.adjust_background} af={self.adjust_foreground}"
 
+class OverlayImage(namedtuple('OverlayImage', 'data width height')):
+    """
+    raw RGBA8888 pixels of a rendered overlay, rows packed without padding
+    """
+    __slots__ = ()
+
+    @property
+    def stride(self):
+        return self.width * 4
+
+
+def plot_iou_chunk(bbl_type, args, run_state, out_dir):
+    """
+    worker side of plot_iou_boxes: load, compare and plot every stem of run_state.
+    one decoded jpg (and the copy being drawn) is alive at a time.
+    returns the files written and the worker's parse cache counts
+    """
+    files = []
+    with worker_bbl(bbl_type, args, run_state) as bbl:
+        for image in run_state['stem2xmls']:
+            bbl.load_xml_for_image(image)
+            files.extend(bbl.pl.plot_image_report(image, out_dir))
+        cache_stats = bbl.parser.cache_stats()
+    return files, cache_stats
+
+
 class Plotter:
+    # images per plot_iou_boxes pool task
+    plot_chunk_size = 16
+
     def __init__(self, bbl, args):
 
         self.bbl = bbl
@@ -69,53 +112,40 @@ class Plotter:
         self.color_palette  = ColorPalette()
         self.color_theme  = "dark" # initial theme
         self.user_to_color = {}
-        self.source_img = defaultdict(lambda: None)
+        # --overlay-cache-mb is split evenly between the two caches below
+        cache_bytes = args.overlay_cache_mb * 1024 * 1024 // 2
+        # rendered overlays with their overlay_stats, keyed by DrawObject.key()
+        self.overlay_cache = LruCache("overlay", cache_bytes,
+                sizeof=lambda entry: len(entry[0].data))
+        # the layers overlays are composited from, keyed by what each layer depends on
+        self.layer_cache = LruCache("overlay layer", cache_bytes,
+                sizeof=lambda layer: sum(part.nbytes for part in layer))
         self.img_list = bbl.get_image_list()
         #self.read_images()
-        #self.add_margins()
         self.assign_colors_to_users(self.bbl.stats.user_list)
         self.fnt = self.get_fonts();
         #self.plot_iou_boxes(bbl, args.out)
 
     # make sure all images exist in img_dir
     def read_images(self):
-        logging.info(f"stem2jpgs = {self.bbl.stem2jpgs}")
-        for image, file_name in self.bbl.stem2jpgs.items():
-            logging.debug(f"{image} -> {file_name}")
+        logging.info("stem2jpgs = %s", LogSummary(self.bbl.stem2jpgs))
 
         # see https://stackoverflow.com/questions/11029717/how-do-i-disable-log-messages-from-the-requests-library
         #print(logging.warning(logging.Logger.manager.loggerDict))
         logging.getLogger('PIL.Image').setLevel(logging.CRITICAL)
         logging.getLogger('PIL.ImagePlugin').setLevel(logging.CRITICAL)
 
-        for image, file_name in self.bbl.stem2jpgs.items():
-            if image in self.img_list:
-                ih = Image.open(file_name)
-                self.source_img[image] = ih.copy()
-                ih.close()
-                        
-
-            # check to make sure all needed images exist
+        # check to make sure all needed images exist
         err_exit = False
         for image in self.img_list:
-            if self.source_img[image] is None:
+            file_name = self.bbl.stem2jpgs.get(image)
+            if file_name is None or not exists(file_name):
                 logging.error(f"missing image file for {image}")
                 err_exit = True
 
         if err_exit:
             sys.exit(-1)
 
-
-    def add_margin_image(self, image_name):
-        self.source_img[image_name] = \
-                    self.add_margin(self.source_img[image_name],0,self.margin_x,self.margin_y,0,(1, 1, 1))
-
-
-    def add_margins(self):
-        for image_name in self.img_list:
-            self.source_img[image_name] = \
-                    self.add_margin(self.source_img[image_name],0,self.margin_x,self.margin_y,0,(1, 1, 1))
-
     def get_app_dir(self):
         """
         https://stackoverflow.com/questions/404744/determining-application-path-in-a-python-exe-generated-by-pyinstaller
@@ -167,53 +197,62 @@ class Plotter:
                 i = 0
 
 
-    def plot_iou_boxes(self, bbl, out_dir):
+    def plot_iou_boxes(self, bbl, out_dir, jobs=1):
         """
-        loop thru each image and any annotations on that image to create a report
+        write a report jpg per image and class (class_base_class_type) to out_dir.
+        images go to a process pool in chunks, see plot_iou_chunk, with at most 2 * jobs chunks in flight
         """
-
-        # find all classes per image
-        image_name_to_class = defaultdict(set)
-        for obj in bbl.bbox_obj_list:
-             class_name = f"{obj.class_base}_{obj.class_type}"
-             image_name_to_class[obj.image].add(class_name)
-
-        # create all destination images
-        dest_img = dict()
-        for image_name, class_list in image_name_to_class.items():
-            if image_name in self.source_img:
-                # sort + uniq
-                classes = list(OrderedDict.fromkeys(class_list))
-                for cls in classes:
-                    key = f"{image_name}_{cls}"
-                    dest_img[key] = self.source_img[image_name].copy() 
-                    width, height = dest_img[key].size
-                    txt = f"""
-image = {image_name} class = {cls}
+        os.makedirs(out_dir, exist_ok=True)
+        images = sorted(bbl.stem2xmls.keys())
+        chunks = [bbl.run_state(images[i:i + self.plot_chunk_size])
+                  for i in range(0, len(images), self.plot_chunk_size)]
+        num_files = 0
+        tasks = ((None, (type(bbl), bbl.args, chunk, out_dir)) for chunk in chunks)
+        for _, (files, cache_stats) in pool_map(plot_iou_chunk, tasks, jobs if len(chunks) > 1 else 1):
+            bbl.parser.add_cache_stats(cache_stats)
+            num_files += len(files)
+        logging.info(f"plot_iou_boxes: {num_files} reports for {len(images)} images in {out_dir}")
+        return num_files
+
+    def plot_image_report(self, image, out_dir):
+        """
+        decode the jpg of one compared image once and save a copy per class with its boxes drawn,
+        returns the files written
+        """
+        classes = defaultdict(list)
+        for obj in self.bbl.bbox_obj_list[image]:
+            classes[(obj.class_base, obj.class_type)].append(obj)
+        if not classes:
+            return []
+
+        with Image.open(self.bbl.stem2jpgs[image]) as ih:
+            source = self.add_margin(ih, 0, self.margin_x, self.margin_y, 0, (1, 1, 1))
+        width, height = source.size
+
+        files = []
+        for (class_base, class_type), obj_list in sorted(classes.items()):
+            cls = f"{class_base}_{class_type}"
+            dest = source.copy()
+            img1 = ImageDraw.Draw(dest)
+            txt = f"""
+image = {image} class = {cls}
 """
-                    img1 = ImageDraw.Draw(dest_img[key])
-                    img1.multiline_text((10,height-self.margin_y), txt , font=self.fnt['bold'], fill=(255, 255, 255))
-
-        # loop thru all boxes and draw them on dest
-        #fnt = ImageFont.truetype('cour.ttf', 14)
-        for obj in bbl.bbox_obj_list:
-            key = f"{obj.image}_{obj.class_base}_{obj.class_type}"
-            if key in dest_img:
-                img1 = ImageDraw.Draw(dest_img[key])
+            img1.multiline_text((10,height-self.margin_y), txt , font=self.fnt['bold'], fill=(255, 255, 255))
+
+            ref_user = self.bbl.get_best_ref_user(image, class_base)
+            for obj in obj_list:
                 img1.rounded_rectangle(obj.bbox, radius=10, fill=None, outline=(0,255,0,128), width=2)
-                ref_user = bbl.get_best_ref_user(obj.image, obj.class_base)
                 if ref_user != obj.user:
                     iou_value = obj.iou[ref_user]
                     txt = f"iou={iou_value:.2f}"
                     x1, y1, x2, y2 = obj.bbox
                     img1.text((x1+10,y1+10), txt , font=self.fnt['bold'], fill=(0, 0, 0))
-                #img1.rounded_rectangle(revised_box, radius=10, fill=None, outline=(255,0,0,128), width=2)
 
-        # save destination images
-        for key in dest_img.keys():
-            file_name = f"{out_dir}/{key}.jpg"
-            dest_img[key].save(file_name)
-        
+            file_name = join(out_dir, f"{image}_{cls}.jpg")
+            dest.save(file_name)
+            files.append(file_name)
+        return files
+
     def mark_boxes_in_ref_missing_in_user(self, img, dset, obj_list):
        """
        look for a property on obj_list of ref user for associated user
@@ -249,43 +288,58 @@ image = {image_name} class = {cls}
 
 
     def fetch_overlay_image(self, dset):
+        """
+        OverlayImage for dset, from the cache when the same settings were drawn recently
+        """
+        # the box list version changes whenever boxes of the image are (re)loaded
+        key = (dset.key(), self.bbl.bbox_obj_list[dset.image].version)
+        entry = self.overlay_cache.get(key)
+        if entry is None:
+            img_data = self.render_overlay_image(dset)
+            self.overlay_cache.put(key, (img_data, dset.overlay_stats))
+        else:
+            img_data, dset.overlay_stats = entry
+            # keep user colors in step with what a render would have left behind
+            self.color_theme = dset.color_theme
+            self.assign_colors_to_users(dset.active_users)
+            logging.debug(f"overlay cache hit for {dset}")
+        return img_data
 
-        # load if not loaded
-        if not self.source_img[dset.image]:
-            file_name = self.bbl.stem2jpgs[dset.image]
-            ih = Image.open(file_name)
-            self.source_img[dset.image] = ih.copy()
-            ih.close()
-            self.add_margin_image(dset.image)
-
-        # what's the size of thie image?
-        width, height = self.source_img[dset.image].size
-        imgobj = Image.new('RGBA', (width, height), (255, 0, 0, 0))
-        # pad with margin
-        #imgobj = self.add_margin(imgobj,0,0,self.margin_y,0,(1, 1, 1))
-        img = ImageDraw.Draw(imgobj)
+    def image_size(self, image):
+        """
+        (width, height) of the source image with margins, no pixels are decoded (see ImageMeta)
+        """
+        width, height = self.bbl.image_meta.size(image)
+        return (width + self.margin_x, height + self.margin_y)
 
-        # draw a black rectangle on gutters
-        bbox = [0, height - self.margin_y, width, height]
-        img.rectangle(bbox, fill='black', outline='white', width=1)
+    def log_cache_stats(self):
+        for cache in (self.overlay_cache, self.layer_cache):
+            cache.log_stats()
+        logging.info(f"image sizes: {len(self.bbl.image_meta.sizes)} stems, read from {self.bbl.image_meta.sources}")
 
-        bbox = [width - self.margin_x, height - self.margin_y , width, 0]
-        img.rectangle(bbox, fill='black', outline='white', width=1)
+    def render_overlay_image(self, dset):
+        """
+        composite the overlay from cached layers, only layers whose inputs changed are drawn again
+        """
+        # what's the size of thie image?
+        width, height = self.image_size(dset.image)
 
         # update colors
         self.assign_colors_to_users(dset.active_users)
 
-        # first filter based on matching image/class
-        filter_criteria = {}
-        filter_criteria['class_base'] = dset.class_base
-        obj_list = self.bbl.filter(self.bbl.bbox_obj_list[dset.image], **filter_criteria)
-
-        # now visible users only
-        obj_list = self.bbl.filter_visible_users(obj_list, dset.visible_users)
+        # first filter based on matching image/class and visible users, answered from the image index
+        bbox_obj_list = self.bbl.bbox_obj_list[dset.image]
+        visible_users = [user for user, visible in dset.visible_users.items() if visible]
+        obj_list_t = {}
+        for class_type in self.bbl.stats.class_type_list:
+            obj_list_t[class_type] = self.bbl.filter(bbox_obj_list,
+                    class_base = dset.class_base,
+                    class_type = class_type,
+                    user       = visible_users)
 
-        # if iou filter then prune here
-        if dset.iou_filter_value < 10:
-            obj_list = self.bbl.filter_by_iou_value(obj_list, dset.ref_user,  dset.iou_filter_value)
+            # if iou filter then prune here
+            if dset.iou_filter_value < 10:
+                obj_list_t[class_type] = self.bbl.filter_by_iou_value(obj_list_t[class_type], dset.ref_user,  dset.iou_filter_value)
 
 
         # ok now update color theme
@@ -296,46 +350,132 @@ image = {image_name} class = {cls}
         # reset stats
         dset.overlay_stats['outer_assoc']['associated'] = 0
         dset.overlay_stats['outer_assoc']['not_associated'] = 0
-        
-        # handle the 3 class_type: outer inner inout
+
+        # stats cover every class_type, visible or not
         for class_type in self.bbl.stats.class_type_list:
-            if class_type == 'inout':
+            if class_type != 'inout':
+                self.collect_overlay_stats(dset, obj_list_t[class_type])
+
+        # the gutters are the bottom layer and cheap to draw, so they are drawn in place
+        imgobj = Image.new('RGBA', (width, height), (255, 0, 0, 0))
+        self.draw_gutters(ImageDraw.Draw(imgobj), (width, height))
+        # one uint32 per pixel, so layers gather and scatter whole pixels
+        canvas = np.frombuffer(bytearray(imgobj.tobytes()), dtype=np.uint32)
+        for layer in self.overlay_layers(dset, obj_list_t, visible_users):
+            self.composite_layer(canvas, layer)
+
+        # brightness (adjust_foreground) is applied by the canvas when painting
+        return OverlayImage(canvas.tobytes(), width, height)
+
+    @staticmethod
+    def composite_layer(canvas, layer):
+        """
+        put layer on the canvas, RGBA packed in uint32, the way ImageDraw would have drawn it there.
+        a layer drawn on a transparent canvas holds the ink color with its coverage as alpha.
+        ImageDraw blends color and alpha linearly by coverage, but takes the ink color as is where
+        the canvas is still transparent. Image.alpha_composite weighs colors by the alpha of both
+        sides instead, which shifts antialiased text wherever layers overlap.
+        only pixels where antialiased ink overlaps other antialiased ink of the same layer come out
+        a little different, the layer keeps just their combined value (see tests/test_plotter.py)
+        """
+        solid, solid_pixels, edge, ink = layer
+        canvas[solid] = solid_pixels
+
+        under = canvas[edge].view(np.uint8).reshape(-1, 4).astype(np.uint16)
+        ink = ink.astype(np.uint16)
+        cover = ink[:, 3:4]
+        blended = under * (255 - cover) + ink * cover
+        blended[:, 3:4] = under[:, 3:4] * (255 - cover) + 255 * cover
+        # same rounding as PIL's DIV255
+        blended += 128
+        blended = ((blended >> 8) + blended) >> 8
+        blended[:, :3] = np.where(under[:, 3:4] == 0, ink[:, :3], blended[:, :3])
+        canvas[edge] = blended.astype(np.uint8).view(np.uint32).ravel()
+
+    def overlay_layers(self, dset, obj_list_t, visible_users):
+        """
+        layers above the gutters, bottom up: outer boxes, inout connectors, inner boxes,
+        missing markers and the legends. box and connector layers are per user
+        """
+        size = self.image_size(dset.image)
+        version = self.bbl.bbox_obj_list[dset.image].version
+        # everything a layer of one user depends on besides its boxes
+        box_key = (dset.image, version, dset.class_base, dset.ref_user, dset.iou_filter_value)
+        # markers and legends show stats over all visible users
+        stats_key = (dset.image, version, dset.class_base, dset.ref_user, dset.iou_filter_value,
+                     tuple(dset.active_users), tuple(dset.visible_users.items()), dset.color_theme)
+
+        # stack users in box list order, the order their boxes used to be drawn in
+        seq = self.bbl.bbox_obj_list[dset.image]
+        user_codes = self.bbl.store.codes['user'][seq.index_array()].tolist()
+        first_pos = {code: pos for pos, code in reversed(list(enumerate(user_codes)))}
+        user_order = sorted(visible_users, key=lambda user: first_pos.get(self.bbl.store.user.codes.get(user), len(user_codes)))
+
+        layers = []
+        for class_type in ('outer', 'inout', 'inner'):
+            if not dset.visible_types[class_type]:
                 continue
+            # inout connectors are drawn from the outer boxes
+            list_type = 'outer' if class_type == 'inout' else class_type
+            for user in user_order:
+                obj_list = [obj for obj in obj_list_t[list_type] if obj.user == user]
+                color = self.user_to_color[user]
+                key = ('boxes', class_type, user, color) + box_key
+                draw = lambda img, obj_list=obj_list, class_type=class_type: \
+                        self.draw_boxes_for_object(img, obj_list, dset.ref_user, class_type)
+                layers.append(self.fetch_layer(key, size, draw))
 
-            obj_list_f = self.bbl.filter(obj_list, class_type = class_type)
-            self.collect_overlay_stats(dset, obj_list_f)
-            if dset.visible_types[class_type]:
-                self.draw_boxes_for_object(img, obj_list_f, dset.ref_user, class_type)
-            # handle inout class type on 'outer' loop
-            if class_type == 'outer' and dset.visible_types['inout']:
-                self.draw_boxes_for_object(img, obj_list_f, dset.ref_user, 'inout')
-        
         # mark missing box labels .. assume totals have been calculated
         # only for outer
-
-        #for obj in obj_list:
-        #    logging.info(f" before filter: n={obj.user} c={obj.class_type}")
-        obj_list_f = self.bbl.filter(obj_list, 
-                user = dset.ref_user, 
-                class_type='outer')
-        #logging.info(f" after filter: {obj_list_f}")
-        #for obj in obj_list_f:
-        #    logging.info(f" after filter: n={obj.user} c={obj.class_type}")
-        self.mark_boxes_in_ref_missing_in_user(img, dset, obj_list_f)
+        ref_list = self.bbl.filter(obj_list_t['outer'], user = dset.ref_user)
+        layers.append(self.fetch_layer(('missing',) + stats_key, size,
+                lambda img: self.mark_boxes_in_ref_missing_in_user(img, dset, ref_list)))
 
         # draw a key on top left
+        layers.append(self.fetch_layer(('legend',) + stats_key, size, lambda img: self.draw_legends(img, dset)))
+        return layers
+
+    def fetch_layer(self, key, size, draw):
+        """
+        one overlay layer, see layer_pixels. draw(img) renders it on a transparent canvas when it is not cached
+        """
+        layer = self.layer_cache.get(key)
+        if layer is None:
+            imgobj = Image.new('RGBA', size, (0, 0, 0, 0))
+            draw(ImageDraw.Draw(imgobj))
+            layer = self.layer_pixels(imgobj)
+            self.layer_cache.put(key, layer)
+        return layer
+
+    @staticmethod
+    def layer_pixels(imgobj):
+        """
+        what was drawn on imgobj as (solid, solid_pixels, edge, edge_pixels): positions in the flattened
+        image of fully covered and of antialiased pixels with their RGBA values, packed in uint32 for
+        the solid ones. a layer is mostly thin lines, so this is far smaller than the image
+        """
+        x0, y0, x1, y1 = imgobj.getbbox() or (0, 0, 1, 1)
+        pixels = np.frombuffer(imgobj.crop((x0, y0, x1, y1)).tobytes(), dtype=np.uint32)
+        rgba = pixels.view(np.uint8).reshape(-1, 4)
+        solid = np.flatnonzero(rgba[:, 3] == 255)
+        edge = np.flatnonzero((rgba[:, 3] > 0) & (rgba[:, 3] < 255))
+        # positions in the crop to positions in the image
+        to_image = lambda pos: (pos // (x1 - x0) + y0) * imgobj.width + pos % (x1 - x0) + x0
+        return (to_image(solid), pixels[solid], to_image(edge), rgba[edge])
+
+    def draw_legends(self, img, dset):
         self.draw_left_legend_for_overlay(img, dset)
         self.draw_right_legend_for_overlay(img, dset)
 
-        # factor : 0.5 darkens to 1.5 lightens:  adjust_foreground is from 0 to 10
-        # map a number from 0 to 10 to 0.5 to 1.5
-        factor =  (dset.adjust_foreground / 5.0) 
-        enhancer = ImageEnhance.Brightness(imgobj)
-        imgobj = enhancer.enhance(factor)
+    def draw_gutters(self, img, size):
+        width, height = size
+
+        # draw a black rectangle on gutters
+        bbox = [0, height - self.margin_y, width, height]
+        img.rectangle(bbox, fill='black', outline='white', width=1)
 
-        bytes_img = io.BytesIO()
-        imgobj.save(bytes_img, format='PNG')
-        return bytes_img.getvalue()
+        bbox = [width - self.margin_x, height - self.margin_y , width, 0]
+        img.rectangle(bbox, fill='black', outline='white', width=1)
 
     def get_text_for_report_line(self, ref_user, iou_min, iou_max, u_count, user):
 
@@ -360,7 +500,7 @@ image = {image_name} class = {cls}
         """
         a table of shown values
         """
-        width, height = self.source_img[dset.image].size
+        width, height = self.image_size(dset.image)
 
         # find longest name user and assume user is ref
         max_username = max(dset.visible_users.keys())
@@ -423,7 +563,7 @@ image = {image_name} class = {cls}
         """
         tile and stuff
         """
-        width, height = self.source_img[dset.image].size
+        width, height = self.image_size(dset.image)
         xloc = 100
         yloc = height - self.margin_y 
         header_txt = f"{dset.class_base} on {dset.image}"
@@ -486,7 +626,7 @@ image = {image_name} class = {cls}
                     dset.overlay_stats['iou_min'][user] = iou_value
                 #logging.info(f" iou[{dset.ref_user}] for {user} = {iou_value} min={ dset.overlay_stats['iou_min'][user]} max={dset.overlay_stats['iou_max'][user]}")
 
-        logging.debug(f" stats = {dset.overlay_stats}")
+        logging.debug(" stats = %s", LogSummary(dset.overlay_stats))
         #import pdb; pdb.set_trace()
 
                     
@@ -543,7 +683,7 @@ image = {image_name} class = {cls}
         x1, y1, x2, y2 = obj.bbox
         xloc = (x1+x2) / 2
         yloc = (y1+y2) / 2
-        width, height = self.source_img[obj.image].size
+        width, height = self.image_size(obj.image)
         textwidth, textheight = img.textsize(txt, self.fnt['bold'])
         xloc -= round(textwidth / 2)
         yloc -= round(textheight / 2)
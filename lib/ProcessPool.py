@@ -0,0 +1,52 @@
+"""
+ProcessPool: process pool helpers shared by Parser, Plotter, AgreementReport and BatchRunner
+
+pool_map runs chunked work in task order on a bounded process pool, worker_bbl gives a pool
+worker its own BboxList for one chunk. the BboxList class is handed in by the caller, so this
+module imports nothing that imports it back
+"""
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+
+from lib.LogQueue import LogQueue
+
+
+def pool_map(worker, tasks, jobs):
+    """
+    yields (context, worker(*worker_args)) for every (context, worker_args) of tasks, in task order.
+    runs in this process when jobs <= 1, else on a process pool with at most 2 * jobs tasks in flight
+    so memory stays flat on big datasets. tasks is consumed lazily, worker_args None yields None
+    without a call
+    """
+    if jobs <= 1:
+        for context, worker_args in tasks:
+            yield context, None if worker_args is None else worker(*worker_args)
+        return
+
+    def result(context, future):
+        return context, None if future is None else future.result()
+
+    with ProcessPoolExecutor(max_workers=jobs, **LogQueue.pool_args()) as pool:
+        in_flight = deque()
+        for context, worker_args in tasks:
+            future = None if worker_args is None else pool.submit(worker, *worker_args)
+            in_flight.append((context, future))
+            if len(in_flight) >= 2 * jobs:
+                yield result(*in_flight.popleft())
+        while in_flight:
+            yield result(*in_flight.popleft())
+
+
+@contextmanager
+def worker_bbl(bbl_type, args, run_state):
+    """
+    bbl_type (the BboxList class, type(bbl) of the caller) for the stems of run_state
+    (see BboxList.run_state), closes its parse cache
+    """
+    bbl = bbl_type(args, run_state=run_state)
+    try:
+        yield bbl
+    finally:
+        if bbl.parser.cache is not None:
+            bbl.parser.cache.close()
@@ -0,0 +1,31 @@
+"""
+Trace: caller information for debug logs, only gathered when --trace is on
+
+callers are read straight from the frame objects, no source lines are loaded.
+call sites check Trace.enabled first so a disabled trace costs one attribute lookup
+"""
+import sys
+
+
+class Trace:
+    enabled = False
+
+    @staticmethod
+    def caller(depth=1):
+        """
+        name of the function depth levels above the one calling caller()
+        """
+        return sys._getframe(depth + 1).f_code.co_name
+
+    @staticmethod
+    def stack(limit=None):
+        """
+        innermost first list of 'function file:line' for the code calling stack()
+        """
+        frames = []
+        frame = sys._getframe(1)
+        while frame is not None and (limit is None or len(frames) < limit):
+            code = frame.f_code
+            frames.append(f"{code.co_name} {code.co_filename}:{frame.f_lineno}")
+            frame = frame.f_back
+        return frames
@@ -55,8 +55,13 @@ class Canvas(QWidget):
         self.scale = 1.0
         self.label_font_size = 8
         self.pixmap = QPixmap()
+        # full resolution size of the image, the pixmap may be a reduced level drawn stretched to it
+        self.image_size = QSize()
         self.overlay = QPixmap()
         self.adjust_background = 1
+        self.adjust_foreground = 5
+        # overlay with adjust_foreground applied, made again only when either changes
+        self.adjusted_overlay = None
         self.visible = {}
         self._hide_background = False
         self.hide_background = False
@@ -171,7 +176,7 @@ class Canvas(QWidget):
                     # Don't allow the user to draw outside the pixmap.
                     # Clip the coordinates to 0 or max,
                     # if they are outside the range [0, max]
-                    size = self.pixmap.size()
+                    size = self.image_size
                     clipped_x = min(max(0, pos.x()), size.width())
                     clipped_y = min(max(0, pos.y()), size.height())
                     pos = QPointF(clipped_x, clipped_y)
@@ -464,11 +469,11 @@ class Canvas(QWidget):
         Moves a point x,y to within the boundaries of the canvas.
         :return: (x,y,snapped) where snapped is True if x or y were changed, False if not.
         """
-        if x < 0 or x > self.pixmap.width() or y < 0 or y > self.pixmap.height():
+        if x < 0 or x > self.image_size.width() or y < 0 or y > self.image_size.height():
             x = max(x, 0)
             y = max(y, 0)
-            x = min(x, self.pixmap.width())
-            y = min(y, self.pixmap.height())
+            x = min(x, self.image_size.width())
+            y = min(y, self.image_size.height())
             return x, y, True
 
         return x, y, False
@@ -477,7 +482,7 @@ class Canvas(QWidget):
         index, shape = self.h_vertex, self.h_shape
         point = shape[index]
         if self.out_of_pixmap(pos): 
-            size = self.pixmap.size()
+            size = self.image_size
             clipped_x = min(max(0, pos.x()), size.width())
             clipped_y = min(max(0, pos.y()), size.height())
             pos = QPointF(clipped_x, clipped_y)
@@ -517,8 +522,8 @@ class Canvas(QWidget):
             pos -= QPointF(min(0, o1.x()), min(0, o1.y()))
         o2 = pos + self.offsets[1]
         if self.out_of_pixmap(o2):
-            pos += QPointF(min(0, self.pixmap.width() - o2.x()),
-                           min(0, self.pixmap.height() - o2.y()))
+            pos += QPointF(min(0, self.image_size.width() - o2.x()),
+                           min(0, self.image_size.height() - o2.y()))
         # The next line tracks the new position of the cursor
         # relative to the shape, but also results in making it
         # a bit "shaky" when nearing the border and allows it to
@@ -584,9 +589,11 @@ class Canvas(QWidget):
         p.setBrush(QBrush(Qt.black, Qt.SolidPattern))
         #p.drawRect(0,0, self.pixmap.width(), self.pixmap.height())
         p.drawRect(0,0, self.overlay.width(), self.overlay.height())
-        p.drawPixmap(0, 0, self.pixmap)
+        p.drawPixmap(QRectF(0, 0, self.image_size.width(), self.image_size.height()), self.pixmap,
+                     QRectF(self.pixmap.rect()))
         p.setOpacity(self.adjust_background / 10.0)
-        p.drawPixmap(0, 0, self.overlay)
+        p.drawPixmap(0, 0, self.get_adjusted_overlay())
+        p.setOpacity(1.0)
 
         Shape.scale = self.scale
         Shape.label_font_size = self.label_font_size
@@ -613,8 +620,8 @@ class Canvas(QWidget):
 
         if self.drawing() and not self.prev_point.isNull() and not self.out_of_pixmap(self.prev_point):
             p.setPen(QColor(0, 0, 0))
-            p.drawLine(self.prev_point.x(), 0, self.prev_point.x(), self.pixmap.height())
-            p.drawLine(0, self.prev_point.y(), self.pixmap.width(), self.prev_point.y())
+            p.drawLine(self.prev_point.x(), 0, self.prev_point.x(), self.image_size.height())
+            p.drawLine(0, self.prev_point.y(), self.image_size.width(), self.prev_point.y())
 
         self.setAutoFillBackground(True)
         if self.verified:
@@ -637,7 +644,7 @@ class Canvas(QWidget):
 
     def clip_pos(self, pos):
         if self.out_of_pixmap(pos):
-            size = self.pixmap.size()
+            size = self.image_size
             clipped_x = min(max(0, pos.x()), size.width())
             clipped_y = min(max(0, pos.y()), size.height())
             pos = QPointF(clipped_x, clipped_y)
@@ -654,14 +661,14 @@ class Canvas(QWidget):
     def offset_to_center(self):
         s = self.scale
         area = super(Canvas, self).size()
-        w, h = self.pixmap.width() * s, self.pixmap.height() * s
+        w, h = self.image_size.width() * s, self.image_size.height() * s
         aw, ah = area.width(), area.height()
         x = (aw - w) / (2 * s) if aw > w else 0
         y = (ah - h) / (2 * s) if ah > h else 0
         return QPointF(x, y)
 
     def out_of_pixmap(self, p):
-        w, h = self.pixmap.width(), self.pixmap.height()
+        w, h = self.image_size.width(), self.image_size.height()
         return not (0 <= p.x() <= w and 0 <= p.y() <= h)
 
     def finalise(self):
@@ -693,7 +700,7 @@ class Canvas(QWidget):
     def minimumSizeHint(self):
         if self.pixmap:
             yfudge = 0;
-            psize_old = self.pixmap.size()
+            psize_old = self.image_size
             psize_new = QSize(psize_old.width(), psize_old.height() + 3 * self.footer_block_height + yfudge)
             size = self.scale * psize_new
             #logging.debug(f" size = {self.scale} * {psize_new} = {size} bh={self.footer_block_height}")
@@ -753,8 +760,8 @@ class Canvas(QWidget):
 
     def pan_one_step(self, direction):
         #  TODO: use singleStep() instead? 10% works better though...
-            v_delta = self.pixmap.height() * 0.1
-            h_delta = self.pixmap.width()  * 0.1
+            v_delta = self.image_size.height() * 0.1
+            h_delta = self.image_size.width()  * 0.1
             if direction == 'Left':
                 self.scrollRequest.emit(+h_delta, Qt.Horizontal)
             elif direction == 'Right':
@@ -825,17 +832,69 @@ class Canvas(QWidget):
         self.drawingPolygon.emit(False)
         self.update()
 
-    def load_pixmap(self, pixmap):
+    def load_pixmap(self, pixmap, image_size=None):
         self.pixmap = pixmap
+        self.image_size = QSize(image_size) if image_size is not None else pixmap.size()
         self.shapes = []
         self.repaint()
 
-    def load_overlay(self, overlay, adjust_background):
+    def replace_pixmap(self, pixmap):
+        """
+        show another resolution of the same image, shapes and image_size stay
+        """
+        self.pixmap = pixmap
+        self.update()
+
+    def load_overlay(self, overlay, adjust_background, adjust_foreground=5):
         self.overlay = overlay
+        self.adjusted_overlay = None
         self.adjust_background = adjust_background
+        self.adjust_foreground = adjust_foreground
         self.shapes = []
         self.repaint()
 
+    def set_overlay_adjustments(self, adjust_background, adjust_foreground):
+        """
+        slider changes only repaint, the overlay itself is not rendered again
+        """
+        if adjust_foreground != self.adjust_foreground:
+            self.adjusted_overlay = None
+        self.adjust_background = adjust_background
+        self.adjust_foreground = adjust_foreground
+        self.update()
+
+    def get_adjusted_overlay(self):
+        """
+        overlay brightness scaled by adjust_foreground / 5 (0 darkens fully, 10 doubles), like
+        ImageEnhance.Brightness on the rgba overlay: color scales and clips at 255, alpha is kept
+        (brightening also raises the alpha of antialiased edges)
+        """
+        if self.adjusted_overlay is not None:
+            return self.adjusted_overlay
+        factor = self.adjust_foreground / 5.0
+        if factor == 1.0 or self.overlay.isNull():
+            self.adjusted_overlay = self.overlay
+            return self.overlay
+
+        scale = factor if factor < 1.0 else factor - 1.0
+        pm = self.overlay.copy()
+        p = QPainter(pm)
+        # blend toward black where there is overlay, alpha is untouched
+        p.setCompositionMode(QPainter.CompositionMode_SourceAtop)
+        p.setOpacity(1.0 - scale)
+        p.fillRect(pm.rect(), Qt.black)
+        p.end()
+        if factor > 1.0:
+            # overlay + (factor - 1) * overlay, saturating
+            brighter = self.overlay.copy()
+            p = QPainter(brighter)
+            p.setCompositionMode(QPainter.CompositionMode_Plus)
+            p.drawPixmap(0, 0, pm)
+            p.end()
+            pm = brighter
+        self.adjusted_overlay = pm
+        return pm
+
     def load_shapes(self, shapes):
         self.shapes = list(shapes)
         self.current = None
@@ -886,7 +945,7 @@ class Canvas(QWidget):
 
         self.footer_left_block.setText(self.footer_left_block_text)
 
-        psize = self.pixmap.size()
+        psize = self.image_size
         self.footer_left_block.setTextWidth(800)
         tsize = self.footer_left_block.size()
         
@@ -928,7 +987,7 @@ class Canvas(QWidget):
 
         self.footer_right_block.setText(self.footer_right_block_text)
 
-        psize = self.pixmap.size()
+        psize = self.image_size
         tsize = self.footer_right_block.size()
         self.footer_block_height = max(tsize.height(), self.footer_block_height)
         offsetx = 100
@@ -0,0 +1,76 @@
+"""
+ImagePrefetcher: decode neighbouring images and load their xml on a worker thread
+
+the next and previous depth entries of the image list are read with the given reader and
+run through bbl.load_xml_for_image ahead of time, so next/prev is served from memory.
+only the current window is kept, anything outside it is cancelled or dropped
+"""
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+import logging
+
+
+class ImagePrefetcher:
+
+    def __init__(self, bbl, reader, depth=2, workers=1):
+        self.bbl = bbl
+        self.reader = reader
+        self.depth = depth
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='prefetch')
+        self.futures = {}
+        self.closed = False
+        self.hits = 0
+        self.misses = 0
+
+    def window(self, img_list, index):
+        """
+        paths around index, nearest first and next before previous
+        """
+        paths = []
+        for step in range(1, self.depth + 1):
+            for i in (index + step, index - step):
+                if 0 <= i < len(img_list):
+                    paths.append(img_list[i])
+        return paths
+
+    def schedule(self, img_list, index):
+        if self.depth <= 0 or self.closed:
+            return
+        wanted = self.window(img_list, index)
+        for path in list(self.futures):
+            if path not in wanted:
+                self.futures.pop(path).cancel()
+        for path in wanted:
+            if path not in self.futures:
+                self.futures[path] = self.pool.submit(self.load, path)
+        logging.debug(f"prefetch window around {index}: {wanted}")
+
+    def load(self, path):
+        image_data = self.reader(path)
+        self.bbl.load_xml_for_image(Path(path).stem)
+        return image_data
+
+    def take(self, path):
+        """
+        decoded image for path if it was prefetched (waits for a running job), else None
+        """
+        future = self.futures.pop(path, None)
+        if future is None or future.cancelled():
+            self.misses += 1
+            return None
+        try:
+            image_data = future.result()
+        except Exception as err:
+            logging.warning(f"prefetch of {path} failed: {err}")
+            self.misses += 1
+            return None
+        self.hits += 1
+        logging.debug(f"prefetch hit for {path} ({self.hits} hits {self.misses} misses)")
+        return image_data
+
+    def shutdown(self):
+        self.closed = True
+        for future in self.futures.values():
+            future.cancel()
+        self.futures.clear()
+        self.pool.shutdown(wait=True)
@@ -0,0 +1,165 @@
+"""
+ImagePyramid: source jpgs decoded at 1/2 or 1/4 resolution, kept on disk
+
+fit to window usually shows an image at 40-60%, so the first paint only needs a reduced level.
+a level is decoded with QImageReader.setScaledSize, which lets libjpeg scale while decoding, and
+saved once as a small jpg under cache_dir keyed by path, mtime and size; later views read that
+instead. full resolution (factor 1) is always read from the source and never cached.
+the cache is kept under max_bytes by removing the least recently used files, without a
+cache_dir levels are still decoded reduced but nothing is written
+"""
+from collections import namedtuple
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+
+from PySide6.QtCore import QSize
+from PySide6.QtGui import QImageReader, QImageIOHandler
+
+# image: the decoded QImage, full_size: QSize of the full resolution image, factor: 1, 2 or 4
+ViewImage = namedtuple('ViewImage', 'image full_size factor')
+
+
+class ImagePyramid:
+    # reduced levels, coarsest first
+    factors = (4, 2)
+
+    def __init__(self, cache_dir=None, enabled=True, max_bytes=512 * 1024 * 1024):
+        self.cache_dir = cache_dir
+        self.enabled = enabled
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # bytes on disk, counted on the first write; writes come from the gui and prefetch threads
+        self.cache_bytes = None
+        self.lock = threading.Lock()
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    @classmethod
+    def factor_for(cls, scale):
+        """
+        coarsest level that still has a pixel for every screen pixel at scale
+        """
+        for factor in cls.factors:
+            if scale * factor <= 1:
+                return factor
+        return 1
+
+    @staticmethod
+    def full_size(reader):
+        """
+        size of the image reader will produce at full resolution, after the exif transform
+        """
+        size = reader.size()
+        if reader.transformation() & QImageIOHandler.TransformationRotate90:
+            size = size.transposed()
+        return size
+
+    def cache_path(self, path, factor):
+        st = os.stat(path)
+        key = hashlib.sha1(f"{os.path.abspath(path)}|{st.st_mtime_ns}|{st.st_size}".encode()).hexdigest()
+        return os.path.join(self.cache_dir, key[:2], f"{key}_{factor}.jpg")
+
+    def read(self, path, factor=1):
+        """
+        ViewImage of path at 1/factor resolution, a null image if it can't be read
+        """
+        reader = QImageReader(path)
+        reader.setAutoTransform(True)
+        full_size = self.full_size(reader)
+        if factor == 1 or not self.enabled or not full_size.isValid():
+            logging.info(f"reading image = {path}")
+            image = reader.read()
+            return ViewImage(image, image.size(), 1)
+
+        cached = self.cache_path(path, factor) if self.cache_dir else None
+        if cached and os.path.exists(cached):
+            image = QImageReader(cached).read()
+            if not image.isNull():
+                self.hits += 1
+                self.touch(cached)
+                return ViewImage(image, full_size, factor)
+
+        self.misses += 1
+        logging.info(f"reading image = {path} at 1/{factor}")
+        # the scaled size is applied before the exif transform
+        size = reader.size()
+        reader.setScaledSize(QSize(max(1, size.width() // factor), max(1, size.height() // factor)))
+        image = reader.read()
+        if image.isNull():
+            return ViewImage(image, full_size, factor)
+        if cached:
+            self.save(image, cached)
+        return ViewImage(image, full_size, factor)
+
+    @staticmethod
+    def touch(file):
+        """
+        mtime is the last use, see trim
+        """
+        try:
+            os.utime(file)
+        except OSError:
+            pass
+
+    def save(self, image, cached):
+        """
+        write a level through a temp file of its own, so concurrent writers never share a file
+        """
+        cache_dir = os.path.dirname(cached)
+        os.makedirs(cache_dir, exist_ok=True)
+        with tempfile.NamedTemporaryFile(dir=cache_dir, suffix='.tmp', delete=False) as tmp:
+            tmp_path = tmp.name
+        try:
+            if not image.save(tmp_path, "JPG", 90):
+                os.remove(tmp_path)
+                return
+            os.replace(tmp_path, cached)
+        except OSError as err:
+            logging.warning(f"can't write {cached}: {err}")
+            return
+        with self.lock:
+            if self.cache_bytes is None:
+                self.trim()
+            else:
+                self.cache_bytes += os.path.getsize(cached)
+                if self.cache_bytes > self.max_bytes:
+                    self.trim()
+
+    def trim(self):
+        """
+        count the cache and remove least recently used files until it is back under 90% of max_bytes.
+        called with lock held
+        """
+        files = []
+        for root, _, names in os.walk(self.cache_dir):
+            for name in names:
+                file = os.path.join(root, name)
+                try:
+                    st = os.stat(file)
+                except OSError:
+                    continue
+                files.append((st.st_mtime_ns, st.st_size, file))
+        total = sum(size for _, size, _ in files)
+        if total > self.max_bytes:
+            for _, size, file in sorted(files):
+                if total <= 0.9 * self.max_bytes:
+                    break
+                try:
+                    os.remove(file)
+                except OSError:
+                    continue
+                total -= size
+                self.evictions += 1
+        self.cache_bytes = total
+
+    def log_stats(self):
+        if self.cache_dir is None:
+            logging.info(f"image pyramid: {self.misses} reduced decodes, no disk cache")
+            return
+        logging.info(f"image pyramid: {self.hits} hits {self.misses} misses {self.evictions} evicted,"
+                     f" {(self.cache_bytes or 0) / 1024 / 1024:.1f} MB in {self.cache_dir}")
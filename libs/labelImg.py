@@ -10,7 +10,6 @@ import subprocess
 import shutil
 import webbrowser as wb
 import logging
-import inspect
 from enum import Enum
 import argparse
 from pathlib import Path
@@ -30,12 +29,16 @@ from collections import Counter
 
 from functools import partial
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 
 from lib.Plotter import DrawObject
+from lib.Trace import Trace
+from lib.LogSummary import LogSummary
 from lib.ColorPalette import ColorPalette
+from lib.ParseCache import ParseCache
 
 from PySide6.QtGui import QTextLine, QAction, QImage, QColor, QCursor, QPixmap, QImageReader, QFont, QPainter
-from PySide6.QtCore import QObject, Qt, QPoint, QSize, QByteArray, QTimer, QFileInfo, QPointF, QProcess, QRect
+from PySide6.QtCore import QObject, Qt, QPoint, QSize, QByteArray, QTimer, QFileInfo, QPointF, QProcess, QRect, Signal
 from PySide6.QtWidgets import QMainWindow, QVBoxLayout, QCheckBox, QLineEdit, QHBoxLayout, QWidget, QToolButton, \
     QListWidget, QDockWidget, QScrollArea, QWidgetAction, QMenu, QApplication, QLabel, QMessageBox, QFileDialog, \
     QListWidgetItem, QGroupBox, QSlider, QDialog, QRubberBand, QComboBox
@@ -58,6 +61,8 @@ from libs.toolBar import ToolBar
 from libs.pascal_voc_io import PascalVocReader
 from libs.pascal_voc_io import XML_EXT
 from libs.yolo_io import YoloReader
+from libs.imagePrefetcher import ImagePrefetcher
+from libs.imagePyramid import ImagePyramid
 from libs.yolo_io import TXT_EXT
 from libs.create_ml_io import CreateMLReader
 from libs.create_ml_io import JSON_EXT
@@ -93,6 +98,8 @@ class WindowMixin(object):
 
 class MainWindow(QMainWindow, WindowMixin):
     FIT_WINDOW, FIT_WIDTH, MANUAL_ZOOM = list(range(3))
+    # (draw object, future) of a finished overlay render, delivered on the gui thread
+    overlayRendered = Signal(object, object)
     class ZoomMode(Enum):
         FIT_WINDOW   = "fit_window"
         FIT_WIDTH    = "fit_width"
@@ -119,6 +126,28 @@ class MainWindow(QMainWindow, WindowMixin):
         self.current_image = None
         self.current_draw_object = None
         self.iou_filter_value = 10
+        # images are first decoded at the level fit to window needs, full resolution only on zoom in
+        pyramid_dir = None
+        if not bbl.args.no_cache:
+            pyramid_dir = os.path.join(bbl.args.cache or ParseCache.get_default_dir(), "pyramid")
+        self.pyramid = ImagePyramid(pyramid_dir, enabled=not bbl.args.no_pyramid,
+                                    max_bytes=bbl.args.pyramid_cache_mb * 1024 * 1024)
+        # (width, height, footer height, device pixel ratio) of the view, read by the prefetch thread
+        self.view_size = None
+        # decodes next/prev images and loads their xml in the background
+        self.prefetcher = ImagePrefetcher(bbl, self.read_for_view, depth=bbl.args.prefetch)
+
+        # redraw requests within redraw_timer's interval collapse into one, overlays render on
+        # render_pool and only the result for current_draw_object is shown
+        self.redraw_force = False
+        self.redraw_timer = QTimer(self)
+        self.redraw_timer.setSingleShot(True)
+        self.redraw_timer.setInterval(20)
+        self.redraw_timer.timeout.connect(self.redraw_now)
+        self.render_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix='render')
+        self.render_future = None
+        self.queued_draw_object = None
+        self.overlayRendered.connect(self.overlay_render_done)
 
         # Load string bundle for i18n
         self.string_bundle = StringBundle.get_bundle()
@@ -629,6 +658,8 @@ class MainWindow(QMainWindow, WindowMixin):
 
         # Application state.
         self.image = QImage()
+        self.image_full_size = QSize()
+        self.image_factor = 1
         self.image_path = None
         self.annotation_path = None
         self.last_open_dir = None
@@ -1313,6 +1344,8 @@ table thead th {
 
     def save_labels(self, annotation_path):
         annotation_path = ustr(annotation_path)
+        # the label file records the full resolution image size
+        self.ensure_resolution(1)
         if self.label_file is None:
             self.label_file = LabelFile()
             self.label_file.verified = self.canvas.verified
@@ -1691,9 +1724,9 @@ table thead th {
         zoom_v = self.record_bar_stats(v_bar)
 
         extra_height = self.canvas.footer_block_height
-        h_percent = px1 / self.canvas.pixmap.width()
-        v_percent = (py1 + 1.5 * extra_height) / (self.canvas.pixmap.height() + 3 * extra_height)
-        logging.debug(f"h_percent = {px1} / {self.canvas.pixmap.width()} = {h_percent}")
+        h_percent = px1 / self.canvas.image_size.width()
+        v_percent = (py1 + 1.5 * extra_height) / (self.canvas.image_size.height() + 3 * extra_height)
+        logging.debug(f"h_percent = {px1} / {self.canvas.image_size.width()} = {h_percent}")
 
         zoom_h.value = h_percent * zoom_h.dlen
         zoom_v.value = v_percent * zoom_v.dlen
@@ -1804,15 +1837,13 @@ table thead th {
 
     def load_image_file(self):
         """Load the specified file, or the last opened file if None."""
-        all_stack_frames = inspect.stack()
-        caller_stack_frame = all_stack_frames[1]
-        caller_name = caller_stack_frame[3]
         #self.reset_state()
         self.canvas.setEnabled(False)
         #if self.image_path is None:
         #    self.image_path = self.settings.get(SETTING_FILENAME)
 
-        logging.debug(f"load {self.image_path=} {caller_name=}---------------------------")
+        if Trace.enabled:
+            logging.debug(f"load {self.image_path=} caller_name={Trace.caller()}---------------------------")
         #abs_image_path = os.path.abspath(image_path)
         abs_image_path = self.image_path
         if abs_image_path in self.m_img_list:
@@ -1828,7 +1859,12 @@ table thead th {
         if abs_image_path and os.path.exists(abs_image_path):
             # Load image:
             # read data first and store for saving into label file.
-            self.image_data = read(abs_image_path, None)
+            self.update_view_size()
+            view = self.prefetcher.take(abs_image_path)
+            if view is None:
+                view = self.read_for_view(abs_image_path)
+            # a reduced level can't be saved from, ensure_resolution(1) sets image_data
+            self.image_data = view.image if view.factor == 1 else None
             self.label_file = None
             self.canvas.verified = False
 
@@ -1836,10 +1872,7 @@ table thead th {
             self.current_image = imgName
             self.bbl.load_xml_for_image(self.current_image)
 
-            if isinstance(self.image_data, QImage):
-                image = self.image_data
-            else:
-                image = QImage.fromData(self.image_data)
+            image = view.image
             if image.isNull():
                 self.error_message(u'Error opening file',
                                    u"<p>Make sure <i>%s</i> is a valid image file." % abs_file_path)
@@ -1847,6 +1880,8 @@ table thead th {
                 return False
 
             self.image = image
+            self.image_full_size = view.full_size
+            self.image_factor = view.factor
             self.status("Loaded %s" % os.path.basename(abs_image_path))
             logging.info(f"Loaded {os.path.basename(abs_image_path)}")
             # ok, now that file is loaded, update combo box
@@ -1857,6 +1892,9 @@ table thead th {
             self.ref_user_box.blockSignals(False)
             self.show_class_list_for_image_file()
 
+            if abs_image_path in self.m_img_list:
+                self.prefetcher.schedule(self.m_img_list, self.m_img_list.index(abs_image_path))
+
 
     def update_image_overlay(self):
 
@@ -1874,7 +1912,7 @@ table thead th {
         #qimage = QImage(image2)
         #self.canvas.load_pixmap(QPixmap.fromImage(image2))
         #self.image = image2
-        self.canvas.load_pixmap(QPixmap.fromImage(self.image))
+        self.canvas.load_pixmap(QPixmap.fromImage(self.image), self.image_full_size)
 
         #self.canvas.load_pixmap(QPixmap.fromImage(image))
         if self.label_file:
@@ -1940,6 +1978,7 @@ table thead th {
                 self.load_yolo_txt_by_filename(txt_path)
 
     def resizeEvent(self, event):
+        self.update_view_size()
         if self.canvas and not self.image.isNull()\
            and self.zoom_mode != self.ZoomMode.MANUAL_ZOOM:
             self.adjust_scale()
@@ -1948,10 +1987,57 @@ table thead th {
     def paint_canvas(self):
         assert not self.image.isNull(), "cannot paint null image"
         self.canvas.scale = 0.01 * self.zoom_widget.value()
-        self.canvas.label_font_size = int(0.02 * max(self.image.width(), self.image.height()))
+        self.canvas.label_font_size = int(0.02 * max(self.image_full_size.width(), self.image_full_size.height()))
+        self.ensure_resolution()
         self.canvas.adjustSize()
         self.canvas.update()
 
+    def update_view_size(self):
+        e = 2.0  # same as scale_fit_window
+        self.view_size = (self.centralWidget().width() - e, self.centralWidget().height() - e,
+                          self.canvas.footer_block_height, self.devicePixelRatioF())
+
+    def fit_scale_for(self, image):
+        """
+        device pixels per image pixel when image is shown fit to window, from its header size only
+        """
+        w1, h1, extra_height, dpr = self.view_size
+        w2, h2 = self.bbl.pl.image_size(image)
+        h2 += extra_height
+        if w1 <= 0 or h1 <= 0 or w2 <= 0 or h2 <= 0:
+            return 1.0
+        return dpr * (w1 / w2 if w2 / h2 >= w1 / h1 else h1 / h2)
+
+    def read_for_view(self, path):
+        """
+        ViewImage of path at the pyramid level fit to window needs, runs on the prefetch thread too
+        """
+        factor = 1
+        stem = Path(path).stem
+        if self.view_size is not None and stem in self.bbl.stem2jpgs:
+            factor = self.pyramid.factor_for(self.fit_scale_for(stem))
+        return self.pyramid.read(path, factor)
+
+    def ensure_resolution(self, factor=None):
+        """
+        swap in a finer level once the zoom needs it, factor=1 loads full resolution
+        """
+        if self.image.isNull() or self.image_factor == 1:
+            return
+        if factor is None:
+            factor = self.pyramid.factor_for(self.canvas.scale * self.devicePixelRatioF())
+        if factor >= self.image_factor:
+            return
+        view = self.pyramid.read(self.image_path, factor)
+        if view.image.isNull():
+            return
+        logging.debug(f"resolution of {self.current_image} from 1/{self.image_factor} to 1/{view.factor}")
+        self.image = view.image
+        self.image_factor = view.factor
+        if view.factor == 1:
+            self.image_data = view.image
+        self.canvas.replace_pixmap(QPixmap.fromImage(self.image))
+
     def adjust_scale(self, initial=False):
         value = self.scalers[self.ZoomMode.FIT_WINDOW if initial else self.zoom_mode]()
         self.zoom_widget.setValue(int(100 * value))
@@ -1967,19 +2053,25 @@ table thead th {
         #w2 = self.canvas.pixmap.width() - 0.0
         #h2 = self.canvas.pixmap.height() + extra_height - 0.0
         #a2 = w2 / h2
-        w2 = self.canvas.overlay.width() - 0.0
-        h2 = self.canvas.overlay.height() + extra_height - 0.0
+        # the overlay renders asynchronously and may still be the previous image's, so the
+        # size comes from the jpg header (the overlay has the same size once it arrives)
+        if self.current_image in self.bbl.stem2jpgs:
+            w2, h2 = self.bbl.pl.image_size(self.current_image)
+        else:
+            w2, h2 = self.canvas.overlay.width(), self.canvas.overlay.height()
+        h2 += extra_height
         a2 = w2 / h2
         return w1 / w2 if a2 >= a1 else h1 / h2
 
     def scale_fit_width(self):
         # The epsilon does not seem to work too well here.
         w = self.centralWidget().width() - 2.0
-        return w / self.canvas.pixmap.width()
+        return w / self.canvas.image_size.width()
 
     def closeEvent(self, event):
         if not self.may_continue():
             event.ignore()
+            return
         settings = self.settings
         # If it loads images from dir, don't load it at the beginning
         if self.dir_name is None:
@@ -1987,6 +2079,14 @@ table thead th {
         else:
             settings[SETTING_FILENAME] = ''
 
+        self.prefetcher.shutdown()
+        self.redraw_timer.stop()
+        # a render still running must not call back into the closing window
+        self.overlayRendered.disconnect(self.overlay_render_done)
+        self.render_pool.shutdown(wait=False, cancel_futures=True)
+        self.bbl.pl.log_cache_stats()
+        self.bbl.parser.log_cache_stats()
+        self.pyramid.log_stats()
         settings[SETTING_WIN_SIZE] = self.size()
         settings[SETTING_WIN_POSE] = self.pos()
         settings[SETTING_WIN_STATE] = self.saveState()
@@ -2082,7 +2182,7 @@ table thead th {
 
     def import_filelist_images(self):
         """
-        load images from key in self.pl.source_img
+        load images from key in self.bbl.stem2jpgs
         """
         if not self.may_continue():
             logging.debug(f"self.may_continue = {self.may_continue()}")
@@ -2090,7 +2190,7 @@ table thead th {
 
         self.file_list_widget.clear()
 
-        logging.debug(f" {self.bbl.stem2jpgs=}")
+        logging.debug(" self.bbl.stem2jpgs=%s", LogSummary(self.bbl.stem2jpgs))
         for imgName, imgPath in self.bbl.stem2jpgs.items():
             self.image_basename_to_path[imgName] = imgPath
             self.path_to_image_basename[imgPath] = imgName
@@ -2134,11 +2234,11 @@ table thead th {
             if self.bbl.stats.image_to_class_map[imgName]:
                 self.image_basename_to_path[imgName] = imgPath
                 self.path_to_image_basename[imgPath] = imgName
-        logging.debug(f"{self.image_basename_to_path=}")
+        logging.debug("self.image_basename_to_path=%s", LogSummary(self.image_basename_to_path))
 
         self.m_img_list = sorted(list(self.image_basename_to_path.values()))
         self.img_count = len(self.m_img_list)
-        logging.debug(f"{self.m_img_list=} {self.image_path=}")
+        logging.debug("self.m_img_list=%s self.image_path=%r", LogSummary(self.m_img_list), self.image_path)
         self.open_next_image()
         for imgPath in self.m_img_list:
             imgName = self.path_to_image_basename[imgPath]
@@ -2189,11 +2289,9 @@ table thead th {
 
     def open_next_image(self, _value=False):
         # Proceeding next image without dialog if having any label
-        all_stack_frames = inspect.stack()
-        caller_stack_frame = all_stack_frames[1]
-        caller_name = caller_stack_frame[3]
-        logging.debug(f"{caller_name=}---------------------------")
-        logging.debug(f"{all_stack_frames=}---------------------------")
+        if Trace.enabled:
+            logging.debug(f"caller_name={Trace.caller()}---------------------------")
+            logging.debug(f"all_stack_frames={Trace.stack()}---------------------------")
         logging.debug(f"open next image {_value=} {self.dirty=} cont={self.may_continue()} {self.img_count=} {self.image_path=}")
         logging.debug(f"{self.cur_img_idx=}")
         if self.auto_saving.isChecked():
@@ -2415,6 +2513,7 @@ table thead th {
             return
 
         self.set_format(FORMAT_YOLO)
+        self.ensure_resolution(1)
         t_yolo_parse_reader = YoloReader(txt_path, self.image)
         shapes = t_yolo_parse_reader.get_shapes()
         print(shapes)
@@ -2507,19 +2606,20 @@ table thead th {
             self.color_theme = txt
             self.draw_iou_boxes()
 
+    # both sliders are applied at paint time by the canvas, no new overlay is rendered
     def adjust_background_changed(self):
         # get value from slider
         value = self.colorBackgroundSlider.value()
         if self.adjust_background != value:
             self.adjust_background = value
-            self.draw_iou_boxes()
+            self.canvas.set_overlay_adjustments(self.adjust_background, self.adjust_foreground)
 
     def adjust_foreground_changed(self):
         # get value from slider
         value = self.colorForegroundSlider.value()
         if self.adjust_foreground != value:
             self.adjust_foreground = value
-            self.draw_iou_boxes()
+            self.canvas.set_overlay_adjustments(self.adjust_background, self.adjust_foreground)
 
     def set_color_theme_options(self, widget):
         # set the options and also set default
@@ -2548,10 +2648,16 @@ table thead th {
         self.draw_iou_boxes()
             
     def draw_iou_boxes(self, force_draw=False):
-        all_stack_frames = inspect.stack()
-        caller_stack_frame = all_stack_frames[1]
-        caller_name = caller_stack_frame[3]
-        logging.debug(f"draw {caller_name=}---------------------------")
+        """
+        request a redraw, requests arriving within the timer interval are coalesced
+        """
+        if Trace.enabled:
+            logging.debug(f"draw requested caller_name={Trace.caller()}---------------------------")
+        self.redraw_force = self.redraw_force or bool(force_draw)
+        self.redraw_timer.start()
+
+    def redraw_now(self):
+        force_draw, self.redraw_force = self.redraw_force, False
         if not self.current_image:
             logging.debug(f"draw: no image selected")
             return
@@ -2596,21 +2702,43 @@ table thead th {
         if force_draw or dobj != self.current_draw_object:
             self.current_draw_object = dobj
             logging.debug(f"draw: new draw object {dobj}")
-            self.draw_overlay_on_canvas()
-            self.update_widgets_with_overlay_stats()
+            self.start_overlay_render(dobj)
         else:
             logging.debug(f"draw: nothing to do : same settings {dobj}")
         logging.debug(f"draw completed")
 
-    def draw_overlay_on_canvas(self):
+    def start_overlay_render(self, dobj):
+        """
+        render dobj on render_pool, while a render runs only the latest request is kept
+        """
+        if self.render_future is not None and not self.render_future.done():
+            self.queued_draw_object = dobj
+            return
+        self.render_future = self.render_pool.submit(self.bbl.pl.fetch_overlay_image, dobj)
+        self.render_future.add_done_callback(lambda future: self.overlayRendered.emit(dobj, future))
+
+    def overlay_render_done(self, dobj, future):
+        queued, self.queued_draw_object = self.queued_draw_object, None
+        if queued is not None and queued is self.current_draw_object:
+            self.start_overlay_render(queued)
+
+        if dobj is not self.current_draw_object or future.cancelled():
+            logging.debug(f"draw: dropping stale overlay {dobj}")
+            return
+        if future.exception() is not None:
+            logging.error(f"overlay render failed for {dobj}: {future.exception()}")
+            return
+        self.draw_overlay_on_canvas(future.result())
+        self.update_widgets_with_overlay_stats()
+
+    def draw_overlay_on_canvas(self, overlay):
         if self.current_draw_object.image != self.current_image:
             logging.debug(f"mismatch background image")
             return
-        img_data = self.bbl.pl.fetch_overlay_image(self.current_draw_object)
-        qimg = QImage()
-        qimg.loadFromData(img_data, format = 'PNG')
+        # qimg borrows the raw rgba bytes, fromImage makes the copy the canvas keeps
+        qimg = QImage(overlay.data, overlay.width, overlay.height, overlay.stride, QImage.Format_RGBA8888)
         pm = QPixmap.fromImage(qimg)
-        self.canvas.load_overlay(pm, self.adjust_background)
+        self.canvas.load_overlay(pm, self.adjust_background, self.adjust_foreground)
         logging.debug(f"draw_overlay_on_canvas completed")
 
 
@@ -2640,12 +2768,6 @@ def inverted(color):
     return QColor(*[255 - v for v in color.getRgb()])
 
 
-def read(filename, default=None):
-    logging.info(f"reading image = {filename}")
-    reader = QImageReader(filename)
-    reader.setAutoTransform(True)
-    return reader.read()
-
 def dump_process_info():
     proc = Process()
     logging.debug(f"cmd = {proc.cmdline()}")
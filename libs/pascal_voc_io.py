@@ -112,6 +112,8 @@ class PascalVocWriter:
             SubElement(top, 'path').text = self.local_img_path
             checksum = self.sha256sum(self.local_img_path)
             SubElement(top, 'image_sha256').text = checksum
+            # lets a reader tell whether the hash still belongs to the jpg on disk
+            SubElement(top, 'image_bytes').text = str(Path(self.local_img_path).stat().st_size)
 
         source = SubElement(top, 'source')
         database = SubElement(source, 'database')
@@ -0,0 +1,109 @@
+import os
+import random
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+
+from PIL import Image
+
+from compare_image_annotations import parse_args
+from lib.BboxList import BboxList
+from lib.IouEngine import PRUNE_PAIRS
+
+
+def write_xml(path, boxes, stem="img0000"):
+    objects = "".join(f"<object><name>{name}</name><difficult>0</difficult><bndbox><xmin>{x0}</xmin><ymin>{y0}</ymin>"
+                      f"<xmax>{x1}</xmax><ymax>{y1}</ymax></bndbox></object>"
+                      for name, (x0, y0, x1, y1) in boxes)
+    path.write_text(f"<annotation><filename>{stem}.jpg</filename><size><width>64</width><height>64</height>"
+                    f"<depth>3</depth></size>{objects}</annotation>")
+
+
+def test_compute_iou_bbox_pair_zero_area():
+    assert BboxList.compute_iou_bbox_pair(None, [10, 10, 10, 50], [10, 10, 10, 50]) == 0.0
+    assert BboxList.compute_iou_bbox_pair(None, [10, 10, 10, 50], [0, 0, 20, 20]) == 0.0
+    assert BboxList.compute_iou_bbox_pair(None, [0, 0, 10, 10], [0, 0, 10, 10]) == 1.0
+
+
+def test_mislabel_pass_with_zero_area_boxes(tmp_path):
+    for user in ("alice", "bob"):
+        user_dir = tmp_path / user
+        user_dir.mkdir()
+        Image.new("RGB", (64, 64)).save(user_dir / "img0000.jpg")
+        write_xml(user_dir / "img0000.xml", [("carrot_outer", (10, 10, 10, 50)),
+                                             ("weed_outer", (10, 10, 10, 50))])
+    args = parse_args().parse_args(["--data", str(tmp_path), "--out", str(tmp_path / "out"),
+                                    "--no-cache", "--batch"])
+    bbl = BboxList(args)
+    bbl.load_xml_for_image("img0000")
+    bbl.locate_potential_mislabel("img0000")
+    assert all(obj.warning is None for obj in bbl.bbox_obj_list["img0000"])
+
+
+def test_loading_an_image_keeps_other_indexes(tmp_path):
+    for user in ("alice", "bob"):
+        user_dir = tmp_path / user
+        user_dir.mkdir()
+        for stem in ("img0000", "img0001"):
+            Image.new("RGB", (64, 64)).save(user_dir / f"{stem}.jpg")
+            write_xml(user_dir / f"{stem}.xml", [("carrot_outer", (10, 10, 40, 40))], stem)
+    args = parse_args().parse_args(["--data", str(tmp_path), "--out", str(tmp_path / "out"),
+                                    "--no-cache", "--batch"])
+    bbl = BboxList(args)
+    bbl.load_xml_for_image("img0000")
+    index = bbl.bbox_obj_list["img0000"].index()
+    bbl.load_xml_for_image("img0001")
+    assert bbl.bbox_obj_list["img0000"].index() is index
+    assert [obj.user for obj in bbl.filter(bbl.bbox_obj_list["img0001"], user="bob")] == ["bob"]
+
+
+def test_iou_engine_matches_compute_iou_obj_list(tmp_path):
+    random.seed(0)
+    boxes = {"alice": [], "bob": [], "carol": []}
+    for user, num_outer in (("alice", 80), ("bob", 70), ("carol", 6)):
+        for _ in range(num_outer):
+            # coarse grid so equal ious exercise the write order of associated_user
+            x, y = random.randrange(0, 400, 10), random.randrange(0, 400, 10)
+            boxes[user].append(("carrot_outer", (x, y, x + random.randrange(10, 60, 10), y + random.randrange(10, 60, 10))))
+    # exact duplicates tie on iou, only the first of them becomes the running max
+    boxes["bob"] += boxes["bob"][:10]
+    boxes["alice"] += [("carrot_stem", (20, 20, 40, 40)), ("weed_outer", (0, 0, 30, 30))]
+    boxes["bob"] += [("carrot_stem", (25, 25, 40, 45))]
+    # far away pair that overlaps by one pixel: an iou that rounds to the float 0.0, not the int 0
+    boxes["alice"].append(("carrot_outer", (1000, 1000, 1100, 1100)))
+    boxes["bob"].append(("carrot_outer", (1099, 1099, 1200, 1200)))
+    for user, user_boxes in boxes.items():
+        user_dir = tmp_path / user
+        user_dir.mkdir()
+        Image.new("RGB", (64, 64)).save(user_dir / "img0000.jpg")
+        write_xml(user_dir / "img0000.xml", user_boxes)
+    args = parse_args().parse_args(["--data", str(tmp_path), "--out", str(tmp_path / "out"),
+                                    "--no-cache", "--batch"])
+    bbl = BboxList(args)
+    bbl.load_xml_for_image("img0000")
+    obj_list = list(bbl.bbox_obj_list["img0000"])
+    assert 81 * 81 > PRUNE_PAIRS
+
+    engine_iou = [{user: (type(value), value) for user, value in obj.iou.items()} for obj in obj_list]
+    engine_associated = [dict(obj.associated_user) for obj in obj_list]
+    for obj in obj_list:
+        obj.associated_user.clear()
+
+    # one box at a time, the way compute_iou_for_each_annotation did before IouEngine.
+    # the returned iou is kept as is: written to the store an int 0 would read back as 0.0
+    scalar_iou = []
+    for obj_src in obj_list:
+        tgt_all_obj_list = bbl.filter(obj_list, class_base=obj_src.class_base, class_type=obj_src.class_type)
+        row = {}
+        for user in bbl.stats.user_list:
+            if user == obj_src.user:
+                continue
+            tgt_obj_list = bbl.filter(tgt_all_obj_list, user=user)
+            value, _ = bbl.compute_iou_obj_list(obj_src, tgt_obj_list)
+            row[user] = (type(value), value)
+        scalar_iou.append(row)
+
+    assert engine_iou == scalar_iou
+    assert engine_associated == [dict(obj.associated_user) for obj in obj_list]
+    values = {value for row in engine_iou for value in row.values()}
+    assert (int, 0) in values and (float, 0.0) in values
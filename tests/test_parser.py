@@ -0,0 +1,87 @@
+import hashlib
+import io
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from compare_image_annotations import parse_args
+from lib.BboxList import BboxList
+
+
+def jpg_bytes(seed, size):
+    """
+    noisy 400x300 jpg, padded after the end of image marker to size bytes
+    """
+    pixels = np.random.default_rng(seed).integers(0, 256, (300, 400, 3), dtype=np.uint8)
+    buf = io.BytesIO()
+    Image.fromarray(pixels).save(buf, format='JPEG', quality=90)
+    data = buf.getvalue()
+    assert len(data) <= size
+    return data + b'\0' * (size - len(data))
+
+
+def write_copy(user_dir, data):
+    """
+    jpg and an xml as PascalVocWriter saves it, with the jpg's hash, byte count and size
+    """
+    user_dir.mkdir()
+    jpg = user_dir / "img0000.jpg"
+    jpg.write_bytes(data)
+    (user_dir / "img0000.xml").write_text(
+        f"<annotation><filename>img0000.jpg</filename><path>{jpg}</path>"
+        f"<image_sha256>{hashlib.sha256(data).hexdigest()}</image_sha256><image_bytes>{len(data)}</image_bytes>"
+        f"<size><width>400</width><height>300</height><depth>3</depth></size>"
+        f"<object><name>carrot_outer</name><difficult>0</difficult>"
+        f"<bndbox><xmin>10</xmin><ymin>10</ymin><xmax>50</xmax><ymax>50</ymax></bndbox></object></annotation>")
+    return jpg
+
+
+def load(tmp_path):
+    args = parse_args().parse_args(["--data", str(tmp_path), "--out", str(tmp_path / "out"),
+                                    "--no-cache", "--batch"])
+    return BboxList(args)
+
+
+def test_identical_copies_do_not_clash(tmp_path):
+    data = jpg_bytes(0, 200000)
+    write_copy(tmp_path / "alice", data)
+    write_copy(tmp_path / "bob", data)
+    assert load(tmp_path).stem2jpgs["img0000"].endswith("img0000.jpg")
+
+
+def test_copy_replaced_with_mtime_kept_clashes(tmp_path):
+    data = jpg_bytes(0, 200000)
+    write_copy(tmp_path / "alice", data)
+    jpg = write_copy(tmp_path / "bob", data)
+    # cp -p of a different jpg of the same size: bob's stored hash is stale but looks current
+    st = os.stat(jpg)
+    jpg.write_bytes(jpg_bytes(1, 200000))
+    os.utime(jpg, ns=(st.st_atime_ns, st.st_mtime_ns))
+    with pytest.raises(SystemExit):
+        load(tmp_path)
+
+
+def test_cache_written_with_relative_data_read_with_absolute(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    data = jpg_bytes(0, 200000)
+    (tmp_path / "data").mkdir()
+    for user in ("alice", "bob"):
+        write_copy(tmp_path / "data" / user, data)
+
+    for spelling in ("data", str(tmp_path / "data")):
+        args = parse_args().parse_args(["--data", spelling, "--out", str(tmp_path / "out"),
+                                        "--cache", str(tmp_path / "cache"), "--batch"])
+        bbl = BboxList(args)
+        assert list(bbl.iter_parse_images(["img0000"], 1)) == ["img0000"]
+        bbl.load_xml_for_image("img0000")
+        bbl.parser.cache.close()
+
+    assert bbl.parser.cache.hits == 2
+    boxes = bbl.bbox_obj_list["img0000"]
+    assert sorted(obj.user for obj in boxes) == ["alice", "bob"]
+    assert all(obj.dir == str(tmp_path / "data" / obj.user) for obj in boxes)
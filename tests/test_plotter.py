@@ -0,0 +1,96 @@
+import os
+import random
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+
+import numpy as np
+from PIL import Image, ImageDraw
+
+from compare_image_annotations import parse_args
+from lib.BboxList import BboxList
+from lib.Plotter import DrawObject
+
+
+def write_xml(path, boxes, width, height):
+    objects = "".join(f"<object><name>{name}</name><difficult>0</difficult><bndbox><xmin>{x0}</xmin><ymin>{y0}</ymin>"
+                      f"<xmax>{x1}</xmax><ymax>{y1}</ymax></bndbox></object>"
+                      for name, (x0, y0, x1, y1) in boxes)
+    path.write_text(f"<annotation><filename>img0000.jpg</filename><size><width>{width}</width>"
+                    f"<height>{height}</height><depth>3</depth></size>{objects}</annotation>")
+
+
+def load_overlapping_users(tmp_path):
+    """
+    three users with nearly the same boxes, so labels overlap across users and within a user
+    """
+    for shift, user in enumerate(("alice", "bob", "carol")):
+        user_dir = tmp_path / user
+        user_dir.mkdir()
+        Image.new("RGB", (320, 240), "gray").save(user_dir / "img0000.jpg")
+        boxes = []
+        for x in (20, 120, 220):
+            # only alice calls the last plant a carrot, which puts a mis-label warning next to her label
+            name = "weed_other" if x == 220 and user != "alice" else "carrot"
+            x += 3 * shift
+            boxes.append((f"{name}_outer", (x, 40 + shift, x + 80, 160)))
+            boxes.append((f"{name}_outer", (x + 6, 44 + shift, x + 86, 164)))
+            boxes.append((f"{name}_stem", (x + 20, 60, x + 50, 100 + shift)))
+        write_xml(user_dir / "img0000.xml", boxes, 320, 240)
+    args = parse_args().parse_args(["--data", str(tmp_path), "--out", str(tmp_path / "out"),
+                                    "--no-cache", "--batch"])
+    bbl = BboxList(args)
+    bbl.load_xml_for_image("img0000")
+    bbl.associate_stem_with_outer("img0000")
+    bbl.locate_potential_mislabel("img0000")
+    return bbl
+
+
+def render_layered(pl, dset):
+    random.seed(0)
+    pl.layer_cache.clear()
+    overlay = pl.render_overlay_image(dset)
+    return np.frombuffer(overlay.data, np.uint8).reshape(overlay.height, overlay.width, 4)
+
+
+def render_in_place(pl, dset):
+    """
+    every layer drawn straight into one image, the way overlays were drawn before layers
+    """
+    random.seed(0)
+    size = pl.image_size(dset.image)
+    img = Image.new("RGBA", size, (255, 0, 0, 0))
+    draw = ImageDraw.Draw(img)
+    pl.draw_gutters(draw, size)
+
+    def fetch_layer(key, size, draw_layer):
+        draw_layer(draw)
+        return pl.layer_pixels(Image.new("RGBA", size))
+
+    pl.fetch_layer = fetch_layer
+    try:
+        pl.render_overlay_image(dset)
+    finally:
+        del pl.fetch_layer
+    return np.asarray(img)
+
+
+def test_layered_overlay_matches_in_place_drawing(tmp_path):
+    bbl = load_overlapping_users(tmp_path)
+    users = bbl.stats.image_to_active_users_map["img0000"]
+    ref_user = bbl.get_best_ref_user("img0000", "carrot")
+    for visible in ([True, True, True], [True, False, True]):
+        for inner in (True, False):
+            visible_types = {'outer': True, 'inout': inner, 'inner': inner}
+            # a render adds to the stats of its DrawObject, each render gets its own
+            dsets = [DrawObject("img0000", "carrot", ref_user, visible_types, users,
+                                dict(zip(users, visible)), 10, 'dark', 10, 5) for _ in range(2)]
+            layered = render_layered(bbl.pl, dsets[0]).astype(int)
+            in_place = render_in_place(bbl.pl, dsets[1]).astype(int)
+            diff = np.abs(layered - in_place)
+            # the two only differ where antialiased text overlaps other text of the same layer,
+            # PIL blends such edges in an order dependent way that a layer can't carry over
+            drawn = in_place[..., 3] > 0
+            assert diff[..., 3].max() <= 2
+            assert diff.max() <= 64
+            assert (diff.max(axis=-1) > 2).sum() <= 0.001 * drawn.sum()